@@ -0,0 +1,109 @@
+"""
+Search micro-batching - coalesce concurrent /search calls into one encoder pass
+
+Queries arriving within a short window are drained together and embedded with
+a single LegalRAGEngine.encode_queries call (the encoder's latency is nearly
+flat in batch size). Each RAG pipeline then runs concurrently on the executor
+with its precomputed vector.
+"""
+import asyncio
+import functools
+import logging
+import os
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "16"))
+BATCH_WAIT_MS = int(os.getenv("SEARCH_BATCH_WAIT_MS", "50"))
+
+
+class SearchBatcher:
+    """Queue in front of ``rag_engine.ask`` that batches query embedding."""
+
+    def __init__(
+        self,
+        rag_engine,
+        max_batch: int = BATCH_MAX,
+        max_wait_ms: int = BATCH_WAIT_MS,
+        executor=None,
+    ):
+        self.rag_engine = rag_engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
+
+    @property
+    def can_encode(self) -> bool:
+        return hasattr(self.rag_engine, "encode_queries")
+
+    def start(self) -> None:
+        """Start the background drain loop on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the drain loop and fail any requests still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue and not self._queue.empty():
+            _query, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Search batcher stopped"))
+
+    async def encode(self, query: str) -> List[float]:
+        """Queue one query for the next batched encoder pass."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def submit(self, **ask_kwargs) -> dict:
+        """Run one ``rag_engine.ask`` call with a batch-encoded query vector."""
+        if ask_kwargs.get("query_vector") is None and self.can_encode:
+            ask_kwargs["query_vector"] = await self.encode(ask_kwargs["query"])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self.rag_engine.ask, **ask_kwargs)
+        )
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without blocking the next drain window.
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        logger.debug("Encoding search batch of %s", len(batch))
+        try:
+            vectors = await loop.run_in_executor(
+                self.executor, self.rag_engine.encode_queries, [query for query, _ in batch]
+            )
+        except Exception as exc:
+            for _query, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_query, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
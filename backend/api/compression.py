@@ -0,0 +1,139 @@
+"""
+Response compression that leaves server-sent events alone
+
+GZip and Brotli middleware buffer a streaming body inside the compressor
+until it closes, so compressed SSE reaches the client all at once at the
+end. This wrapper routes ``text/event-stream`` responses around the
+compressor and compresses everything else as before.
+
+Clients that send ``Accept-Encoding: zstd`` get zstd instead (when
+zstandard is installed); everyone else falls through to Brotli/GZip.
+"""
+from functools import lru_cache
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Optional zstd response compression (pip install zstandard)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_LEVEL = 3
+
+
+# Scope key carrying the server's own send past the compressor
+UNCOMPRESSED_SEND = "lawscout.uncompressed_send"
+
+
+class SkipEventStreamCompression:
+    """Apply ``compressor`` (e.g. GZipMiddleware) to every response but SSE.
+
+    The compressor is built once around ``_routed_app``; each request's
+    uncompressed ``send`` travels to it in the scope.
+    """
+
+    def __init__(self, app: ASGIApp, compressor, **compressor_options):
+        self.app = app
+        self.compressor = compressor(self._routed_app, **compressor_options)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        scope[UNCOMPRESSED_SEND] = send
+        await self.compressor(scope, receive, send)
+
+    async def _routed_app(self, scope: Scope, receive: Receive, compressed_send: Send) -> None:
+        send = scope[UNCOMPRESSED_SEND]
+        target = compressed_send
+
+        async def route(message: Message) -> None:
+            nonlocal target
+            if message["type"] == "http.response.start":
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                target = send if content_type.startswith("text/event-stream") else compressed_send
+            await target(message)
+
+        await self.app(scope, receive, route)
+
+
+@lru_cache(maxsize=None)
+def _zstd_compressor(level: int):
+    """One compressor per worker and level, reused across responses.
+
+    Only the event loop thread calls it, so sharing one instance is safe.
+    """
+    return zstandard.ZstdCompressor(level=level)
+
+
+def _accepts_zstd(scope: Scope) -> bool:
+    accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+    return any(
+        token.split(";")[0].strip().lower() == "zstd"
+        for token in accept_encoding.split(",")
+    )
+
+
+class ZstdMiddleware:
+    """zstd for complete bodies when the client accepts it, else ``fallback``.
+
+    Streaming bodies are passed through uncompressed; SSE is routed around
+    this middleware by SkipEventStreamCompression anyway.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        level: int = ZSTD_LEVEL,
+        fallback=None,
+        fallback_options: dict = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressor = _zstd_compressor(level) if zstandard is not None else None
+        self.fallback = fallback(app, **(fallback_options or {})) if fallback else app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self.compressor is not None and _accepts_zstd(scope):
+            await _ZstdResponder(self.app, self.minimum_size, self.compressor)(scope, receive, send)
+        else:
+            await self.fallback(scope, receive, send)
+
+
+class _ZstdResponder:
+    def __init__(self, app: ASGIApp, minimum_size: int, compressor):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressor = compressor
+        self.send: Send = None
+        self.initial_message: Message = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_with_zstd)
+
+    async def send_with_zstd(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Hold the headers until the first body chunk decides the encoding
+            self.initial_message = message
+            return
+        if message["type"] == "http.response.body" and self.initial_message is not None:
+            initial_message, self.initial_message = self.initial_message, None
+            headers = MutableHeaders(raw=initial_message["headers"])
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+            ):
+                body = self.compressor.compress(body)
+                headers["Content-Encoding"] = "zstd"
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await self.send(initial_message)
+        await self.send(message)
@@ -11,6 +11,7 @@ class SearchRequest(BaseModel):
     use_hybrid: bool = Field(True, description="Use hybrid search (semantic + BM25)")
     use_reranking: bool = Field(True, description="Use cross-encoder reranking")
     extract_citations: bool = Field(True, description="Extract and link citations")
+    stream: bool = Field(False, description="Stream the answer as server-sent events")
 
 class SourceMetadata(BaseModel):
     title: str
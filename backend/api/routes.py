@@ -2,8 +2,10 @@
 API Routes - Thin wrapper around existing RAG engine
 Optimized for performance to match monolithic Streamlit version
 """
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from auth import models as auth_models, security
@@ -12,35 +14,218 @@ from limiter import limiter
 from .models import SearchRequest, SearchResponse, ErrorResponse
 import logging
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import functools
+import operator
+import os
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+import base64
 import hashlib
-import json
+import numpy as np
+import orjson
+import threading
 import time
 import re
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+# orjson encodes the plain-dict payloads built below directly, so responses
+# skip FastAPI's jsonable_encoder walk over every source and metadata field.
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# RAG calls run on the event loop's default executor, which main.py sizes
+# from RAG_THREAD_POOL_SIZE at startup. The pool absorbs I/O waits (Qdrant,
+# Gemini); this semaphore separately bounds how many pipelines hold model
+# memory at once, queueing the rest fairly instead of starving the pool.
+_rag_slots = asyncio.Semaphore(int(os.getenv("RAG_MAX_CONCURRENCY", "8")))
+
+# main.py loads the RAG engine in the background after startup; searches
+# that arrive first wait this long for it before getting a 503
+RAG_READY_TIMEOUT = float(os.getenv("RAG_READY_TIMEOUT", "30"))
+
+
+class _CachedSearch(NamedTuple):
+    """Encoded search result shared by every user who asks the same query.
+
+    ``body`` is the orjson encoding of ``{"answer": ..., "sources": ...}``
+    without its closing brace, so per-user metadata can be appended on a HIT
+    without re-encoding the (large) sources list.
+    """
+    body: bytes
+    etag: str
+    metadata: dict
+    result_count: int
 
-# Dedicated thread pool executor for RAG operations (reused across requests)
-# This is more efficient than asyncio.to_thread which uses a shared pool
-_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag_worker")
 
 # Simple in-memory cache for query results (LRU cache with 100 entries)
-_query_cache = {}
+_query_cache: "OrderedDict[tuple, _CachedSearch]" = OrderedDict()
 _cache_max_size = 100
+_cache_lock = threading.Lock()
+
+# Popular queries are promoted out of the LRU into a small sticky tier, so a
+# burst of one-off searches can't evict them. Hit counts cover both tiers.
+_HOT_CACHE_SIZE = 16
+_HOT_PROMOTE_HITS = 3
+_hot_cache: "dict[tuple, _CachedSearch]" = {}
+_hit_counts: "Counter[tuple]" = Counter()
+
+# Near-duplicate queries ("what is res judicata?" vs "what is res-judicata")
+# reuse a cached response when their embeddings are this similar
+_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+
+
+class _SemanticIndex:
+    """Unit-normalized FP16 query embeddings for the entries in _query_cache.
+
+    Rows of ``vectors`` align with ``keys``. For 100 entries of 384-768 dims
+    the similarity matmul is well under a millisecond.
+    """
+
+    def __init__(self):
+        self.keys: list = []
+        self.vectors: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def add(self, key: tuple, vector) -> None:
+        unit = self._normalize(vector)
+        if unit is None:
+            return
+        self.discard(key)
+        row = unit.astype(np.float16)[None, :]
+        self.vectors = row if self.vectors is None else np.vstack((self.vectors, row))
+        self.keys.append(key)
+
+    def discard(self, key: tuple) -> None:
+        try:
+            index = self.keys.index(key)
+        except ValueError:
+            return
+        del self.keys[index]
+        self.vectors = np.delete(self.vectors, index, axis=0) if self.keys else None
+
+    def clear(self) -> None:
+        self.keys = []
+        self.vectors = None
+
+    def lookup(self, key: tuple, vector) -> Optional[tuple]:
+        """Most similar cached key with the same collection/limit/flags."""
+        if not self.keys:
+            return None
+        unit = self._normalize(vector)
+        if unit is None:
+            return None
+        sims = np.dot(self.vectors, unit.astype(np.float16))
+        # Only rank the rows that clear the threshold (usually none on a miss)
+        candidates = np.flatnonzero(sims >= _SEMANTIC_CACHE_THRESHOLD)
+        params = key[1:]
+        for index in candidates[np.argsort(sims[candidates])[::-1]]:
+            if self.keys[index][1:] == params:
+                return self.keys[index]
+        return None
 
-def _create_cache_key(request: SearchRequest) -> str:
-    """Create cache key from request parameters"""
-    cache_data = {
-        'query': request.query.lower().strip(),
-        'collection': request.collection,
-        'limit': request.limit,
-        'use_hybrid': getattr(request, 'use_hybrid', True),
-        'use_reranking': getattr(request, 'use_reranking', True),
-        'extract_citations': getattr(request, 'extract_citations', True)
-    }
-    cache_str = json.dumps(cache_data, sort_keys=True)
-    return hashlib.md5(cache_str.encode()).hexdigest()
+
+_semantic_index = _SemanticIndex()
+
+# Searches currently running, keyed like _query_cache, so identical
+# concurrent queries share one RAG pipeline run (single flight)
+_inflight: "dict[tuple, asyncio.Future]" = {}
+
+
+def _cache_lookup_locked(key: tuple) -> Optional[_CachedSearch]:
+    """Look ``key`` up in both tiers, counting the hit; caller holds the lock."""
+    cached = _hot_cache.get(key)
+    if cached is not None:
+        _hit_counts[key] += 1
+        return cached
+    cached = _query_cache.get(key)
+    if cached is None:
+        return None
+    _query_cache.move_to_end(key)
+    _hit_counts[key] += 1
+    if _hit_counts[key] >= _HOT_PROMOTE_HITS:
+        _cache_promote_locked(key)
+    return cached
+
+
+def _cache_promote_locked(key: tuple) -> None:
+    """Move a popular entry from the LRU into the hot tier."""
+    if len(_hot_cache) >= _HOT_CACHE_SIZE:
+        coldest = min(_hot_cache, key=_hit_counts.__getitem__)
+        if _hit_counts[coldest] >= _hit_counts[key]:
+            return
+        # Demote to the most recently used end of the LRU
+        _query_cache[coldest] = _hot_cache.pop(coldest)
+    _hot_cache[key] = _query_cache.pop(key)
+    _cache_trim_locked()
+
+
+def _cache_trim_locked() -> None:
+    """Evict least recently used entries beyond the LRU's capacity."""
+    while len(_query_cache) > _cache_max_size:
+        evicted, _ = _query_cache.popitem(last=False)
+        _semantic_index.discard(evicted)
+        _hit_counts.pop(evicted, None)
+
+
+def _cache_get(key: tuple) -> Optional[_CachedSearch]:
+    """Return a cached search and mark it most recently used."""
+    with _cache_lock:
+        return _cache_lookup_locked(key)
+
+
+def _cache_put(key: tuple, cached: _CachedSearch, query_vector: Optional[list] = None) -> None:
+    """Store a search, evicting the least recently used entry when full."""
+    with _cache_lock:
+        if key in _hot_cache:
+            _hot_cache[key] = cached
+        else:
+            _query_cache[key] = cached
+            _query_cache.move_to_end(key)
+        if query_vector is not None:
+            _semantic_index.add(key, query_vector)
+        _cache_trim_locked()
+
+
+def _cache_get_similar(key: tuple, query_vector: list) -> Optional[_CachedSearch]:
+    """Return a cached search for a paraphrase of ``key``'s query, if any."""
+    with _cache_lock:
+        similar = _semantic_index.lookup(key, query_vector)
+        return _cache_lookup_locked(similar) if similar else None
+
+def _create_cache_key(request: SearchRequest) -> tuple:
+    """Create a hashable cache key from request parameters
+
+    The plain tuple is hashed natively by the cache dict, so no serializer or
+    digest runs on the lookup path; the semantic index also compares its
+    non-query fields directly. Case, repeated whitespace and trailing
+    punctuation in the query don't change the key.
+    """
+    return (
+        _MULTISPACE_RE.sub(' ', request.query.lower()).strip().rstrip(' ?!.'),
+        request.collection,
+        request.limit,
+        request.use_hybrid,
+        request.use_reranking,
+        request.extract_citations,
+    )
+
+# Reporter citation formats, e.g. "123 U.S. 456", "456 F.3d 789", "357 F.3d 1256".
+# Compiled once as a single alternation so each citation is scanned in one pass;
+# the named outer group identifies the reporter and is followed by the
+# (volume, page) groups.
+_COURTLISTENER_CITATION_RE = re.compile(
+    r'(?P<us>(\d+)\s+U\.S\.(?:\s+App\.)?\s+(\d+))'
+    r'|(?P<f>(\d+)\s+F\.\s*(?:2d|3d|4th)?\s+(\d+))'  # Handles F.2d, F.3d, F.4th
+    r'|(?P<sct>(\d+)\s+S\.\s*Ct\.\s+(\d+))'
+    r'|(?P<fsupp>(\d+)\s+F\.\s*Supp\.\s*(?:2d|3d)?\s+(\d+))',
+    re.IGNORECASE,
+)
+_COURTLISTENER_REPORTERS = {"us": "us", "f": "f", "sct": "sct", "fsupp": "f-supp"}
 
 def _construct_courtlistener_url(citation: str) -> str:
     """
@@ -50,488 +235,766 @@ def _construct_courtlistener_url(citation: str) -> str:
     if not citation:
         return None
 
-    # Try to parse common citation formats
-    # Example: "123 U.S. 456" or "456 F.3d 789" or "357 F.3d 1256"
-    patterns = [
-        (r'(\d+)\s+U\.S\.(?:\s+App\.)?\s+(\d+)', 'us'),
-        (r'(\d+)\s+F\.\s*(?:2d|3d|4th)?\s+(\d+)', 'f'),  # Handles F.2d, F.3d, F.4th
-        (r'(\d+)\s+S\.\s*Ct\.\s+(\d+)', 'sct'),
-        (r'(\d+)\s+F\.\s*Supp\.\s*(?:2d|3d)?\s+(\d+)', 'f-supp'),
-    ]
-
-    for pattern, reporter in patterns:
-        match = re.search(pattern, citation, re.IGNORECASE)
-        if match:
-            volume = match.group(1)
-            page = match.group(2)
-            return f"https://www.courtlistener.com/c/{reporter}/{volume}/{page}/"
+    # Extracted citations start with the volume, so an anchored match almost
+    # always succeeds; metadata citations may carry a case-name prefix.
+    match = (_COURTLISTENER_CITATION_RE.match(citation.lstrip())
+             or _COURTLISTENER_CITATION_RE.search(citation))
+    if not match:
+        return None
 
+    reporter = _COURTLISTENER_REPORTERS[match.lastgroup]
+    volume = match.group(match.lastindex + 1)
+    page = match.group(match.lastindex + 2)
+    return f"https://www.courtlistener.com/c/{reporter}/{volume}/{page}/"
+
+# Fallback field names, in priority order, for source metadata that may live
+# either in the nested metadata dict or at the top level of the source.
+_COURT_KEYS = ('court', 'court_name', 'court_string', 'jurisdiction')
+_TITLE_KEYS = ('case_name', 'title', 'filename', 'name')
+_CITATION_KEYS = ('citation', 'case_citation', 'citation_string')
+_URL_KEYS = ('url', 'case_url', 'pdf_url', 'download_url', 'resource_uri', 'absolute_url', 'link')
+_DATE_KEYS = ('date', 'date_filed', 'filing_date', 'date_created', 'date_decided')
+
+def _first_field(metadata: dict, src: dict, keys: tuple):
+    """Return the first truthy value for ``keys``, checking metadata before the source."""
+    md_get = metadata.get
+    src_get = src.get
+    for key in keys:
+        value = md_get(key) or src_get(key)
+        if value:
+            return value
     return None
 
+_MIN_SCORE_THRESHOLD = -0.5  # Filter out results with very negative scores
+
+# Source-transform patterns, compiled once at import rather than per source.
+# Case name followed by citation (e.g., "Hickson Corp. v. N. Crossarm Co., 357 F.3d 1256").
+# The name is a possessive run (Python 3.11+) that stops at a comma or newline,
+# so a start position without a nearby citation fails without backtracking.
+_CASE_WITH_CITATION_RE = re.compile(
+    r'([A-Z][^,\n]{10,120}+)\s*,\s*\d+\s+(?:F\.\s*(?:2d|3d|4th)?|U\.S\.|S\.\s*Ct\.|F\.\s*Supp\.)\s+\d+',
+    re.IGNORECASE,
+)
+# Case name patterns (e.g., "Plaintiff v. Defendant"), kept within one line
+_CASE_NAME_RE = re.compile(
+    r'([A-Z][^.,\n]{5,60}?)\s+(?:v\.?|vs\.?|versus)\s+([A-Z][^.,\n]{5,60}?)',
+    re.IGNORECASE,
+)
+_LINE_CITATION_RE = re.compile(r'\d+\s+(?:U\.S\.|F\.\s*(?:2d|3d|4th)?|S\.\s*Ct\.)', re.IGNORECASE)
+_MIXED_CASE_RE = re.compile(r'[A-Z][a-z]+')
+_TRAILING_PUNCT_RE = re.compile(r'[.,;]+$')
+_MULTISPACE_RE = re.compile(r'\s+')
+
+# Filename cleanup in one pass: exhibit prefixes ("EX-99.1_", "8-K_"), dates
+# (YYYYMMDD, YYYY-MM-DD, ...) and file extensions are dropped; underscores and
+# hyphens become spaces
+_FILE_CLEAN_RE = re.compile(
+    r'^(?:EX-\d+\.\d+_|8-K_|EX-\d+_)'
+    r'|\d{4}[-_]?\d{2}[-_]?\d{2}'
+    r'|\.(?:pdf|txt|docx?)$'
+    r'|(?P<sep>[_-])',
+    re.IGNORECASE,
+)
+
+def _clean_filename_part(match: re.Match) -> str:
+    return ' ' if match.lastgroup == 'sep' else ''
+
+# Comprehensive citation patterns, joined into one alternation so the text is
+# scanned once rather than once per reporter
+_CITATION_PATTERNS = (
+    # Federal Reporter with series (F.2d, F.3d, F.4th) - handles "357 F.3d 1256"
+    r'\d+\s+F\.\s*(?:2d|3d|4th)?\s+\d+',
+    # U.S. Reports
+    r'\d+\s+U\.S\.(?:\s+App\.)?\s+\d+',
+    # Supreme Court
+    r'\d+\s+S\.\s*Ct\.\s+\d+',
+    # Federal Supplement
+    r'\d+\s+F\.\s*Supp\.\s*(?:2d|3d)?\s+\d+',
+    # State reporters
+    r'\d+\s+(?:Cal\.|Cal\.\s*App\.|Cal\.\s*Rptr\.)\s+\d+',  # California
+    r'\d+\s+(?:N\.Y\.|N\.Y\.\s*App\.)\s+\d+',  # New York
+    r'\d+\s+(?:Del\.|Del\.\s*Ch\.)\s+\d+',  # Delaware
+    r'\d+\s+(?:Fla\.|Fla\.\s*App\.)\s+\d+',  # Florida
+    r'\d+\s+(?:Tex\.|Tex\.\s*App\.)\s+\d+',  # Texas
+)
+_ALL_CITATIONS_RE = re.compile('|'.join(f'(?:{p})' for p in _CITATION_PATTERNS), re.IGNORECASE)
+
+# Court patterns near citations (e.g., "(11th Cir. 2004)")
+_COURT_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\((\d+(?:st|nd|rd|th)?\s*(?:Cir\.|D\.C\.|D\.\s*C\.))',  # "11th Cir.", "1st D.C."
+    r'\((Fla\.\s*(?:1st|2d|3d|4th|5th)?\s*DCA?)',  # "Fla. 1st DCA"
+    r'\((Cal\.\s*(?:App\.|Sup\.\s*Ct\.))',  # "Cal. App."
+    r'\((N\.Y\.\s*(?:App\.|Sup\.\s*Ct\.))',  # "N.Y. App."
+))
+_YEAR_PAREN_RE = re.compile(r'\([^)]*(?:19|20)\d{2}\)')
+_YEAR_RE = re.compile(r'(19|20)\d{2}')
+
+# State keywords used to detect state-specific queries and boost matching results
+_STATE_KEYWORDS = {
+    'florida': ['florida', 'fl ', 'fl.', 'fla.', 'fla ', '1st dca', '2d dca', '3d dca', '4th dca', '5th dca', 'fla.'],
+    'california': ['california', 'ca ', 'cal.', 'cal '],
+    'new york': ['new york', 'ny ', 'n.y.'],
+    'texas': ['texas', 'tx ', 'tx.'],
+}
+# One alternation per state, matched against already-lowercased text, so each
+# haystack is scanned once instead of once per keyword
+_STATE_KEYWORD_RES = {
+    state: re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+    for state, keywords in _STATE_KEYWORDS.items()
+}
+
+
+# Contract-type terms: the query terms select a boost, the result terms earn it.
+# Compiled as unions over lowercased text, like _STATE_KEYWORD_RES.
+_SAAS_QUERY_RE = re.compile(r'saas|software as a service|software contract|software license')
+_SAAS_RESULT_RE = re.compile(r'saas|software as a service|software license|subscription|software agreement')
+_CONTRACT_TERMS_RE = re.compile(r'contract|agreement|indemnity|indemnification|warranty')
+
+# Query words used for the off-topic check: alphabetic tokens of 3+ letters,
+# so trailing punctuation ("rights?") and filler words don't dilute the ratio
+_QUERY_WORD_RE = re.compile(r'[a-z]{3,}')
+_STOPWORDS = frozenset((
+    'the', 'and', 'for', 'are', 'was', 'were', 'what', 'which', 'who', 'whom',
+    'when', 'where', 'why', 'how', 'does', 'did', 'can', 'could', 'should',
+    'would', 'with', 'from', 'that', 'this', 'these', 'those', 'into', 'about',
+    'under', 'there', 'their', 'have', 'has', 'had', 'any', 'all', 'not',
+))
+
+
+class _SourceContext(NamedTuple):
+    """Per-query state shared by every source in one transformation."""
+    query_keywords: set
+    detected_state: Optional[str]
+    is_saas_query: bool
+    is_contract_query: bool
+    filter_off_topic: bool
+    match_text: bool  # Whether any check below needs lowercased content
+
+
+def _build_source(src: dict, ctx: _SourceContext) -> Optional[dict]:
+    """Transform one retrieved source, or return None if it is off-topic"""
+    src_get = src.get
+    raw_score = src_get('score', 0.0)
+
+    # Read the text and metadata once; every extraction below reuses them
+    content = src_get('full_text') or src_get('text') or ''
+    content_500 = content[:500]
+    content_1000 = content[:1000]
+    # Get metadata - it might be nested or at top level
+    metadata = src_get('metadata') or {}
+    if not isinstance(metadata, dict):
+        metadata = {}
+    # Lowercase once for the keyword filter and the boosts below
+    if ctx.match_text:
+        content_lower = content.lower()
+        metadata_lower = str(metadata).lower()
+
+    # Additional relevance check: if query has specific keywords, check if result contains them
+    # This improves search relevance by filtering truly off-topic results
+    query_keywords = ctx.query_keywords
+    # Only low-scoring results in a multi-result query with enough keywords can be dropped
+    if ctx.filter_off_topic and raw_score < 0.1 and len(query_keywords) > 2:
+        # Count how many query keywords appear in the result
+        keyword_matches = sum(1 for keyword in query_keywords if keyword in content_lower or keyword in metadata_lower)
+        keyword_ratio = keyword_matches / len(query_keywords)
+
+        # If less than 20% of keywords match and score is low, filter it out
+        if keyword_ratio < 0.2:
+            return None
+
+    # Extract court before relevance boosting so jurisdiction-specific queries
+    # can safely use it. Full text fallback extraction happens below.
+    court = _first_field(metadata, src, _COURT_KEYS)
+
+    # Extract title from multiple possible locations (check both metadata and top-level)
+    title = _first_field(metadata, src, _TITLE_KEYS) or src_get('source') or None
+
+    # If no title in metadata, try to extract from text content
+    if not title or title == 'Unknown':
+        if content:
+            # First, try to extract case name that appears before a citation
+            # Pattern: Case name followed by citation (e.g., "Hickson Corp. v. N. Crossarm Co., 357 F.3d 1256")
+            case_with_citation = _CASE_WITH_CITATION_RE.search(content_500)
+            if case_with_citation:
+                potential_title = case_with_citation.group(1).strip()
+                # Clean up: remove trailing punctuation, ensure it looks like a case name
+                potential_title = _TRAILING_PUNCT_RE.sub('', potential_title)
+                if len(potential_title) > 10 and len(potential_title) < 150:
+                    title = potential_title
+
+            # If that didn't work, look for case name patterns (e.g., "Plaintiff v. Defendant")
+            if not title or title == 'Unknown':
+                case_name_match = _CASE_NAME_RE.search(content_500)
+                if case_name_match:
+                    title = f"{case_name_match.group(1).strip()} v. {case_name_match.group(2).strip()}"
+
+            # If still no title, try to find a title-like line
+            if not title or title == 'Unknown':
+                lines = content[:800].split('\n')
+                for line in lines[:10]:  # Check first 10 lines
+                    line = line.strip()
+                    # Skip very short lines, lines that are all caps (often headers), and lines with citations
+                    if (len(line) > 15 and len(line) < 250 and
+                        not line.isupper() and
+                        not _LINE_CITATION_RE.search(line)):
+                        # Check if it looks like a case name or document title
+                        if _MIXED_CASE_RE.search(line):  # Has mixed case
+                            title = line
+                            break
+
+    # If still no title, try to clean up filename
+    if not title or title == 'Unknown':
+        filename = metadata.get('filename') or src_get('filename') or src_get('source')
+        if filename:
+            # Clean up filename: remove prefixes, dates, extensions, separators
+            title = _MULTISPACE_RE.sub(' ', _FILE_CLEAN_RE.sub(_clean_filename_part, filename)).strip()
+            # Capitalize first letter of each word for readability
+            if title:
+                title = ' '.join(word.capitalize() if word.islower() else word for word in title.split())
+
+    # Final fallback
+    if not title:
+        title = 'Unknown'
+
+    # Extract ALL citations from text (not just the first one)
+    # This improves citation usefulness per our core principles
+    all_citations = []
+
+    # First, check metadata for citation
+    citation = _first_field(metadata, src, _CITATION_KEYS)
+
+    if citation:
+        all_citations.append(citation)
+
+    # Extract all citations from text content (up to first 3000 chars for performance)
+    if content:
+        # Find all citations in the text
+        found_citations = set()  # Use set to avoid duplicates
+        content_3000 = content[:3000]
+        for match in _ALL_CITATIONS_RE.finditer(content_3000):
+            # Clean up citation (remove extra spaces)
+            cit = _MULTISPACE_RE.sub(' ', match.group(0).strip())
+            if cit not in found_citations:
+                found_citations.add(cit)
+                all_citations.append(cit)
+
+        # If we found citations, use the first one as primary, but keep all
+        if all_citations and not citation:
+            citation = all_citations[0]
+
+    # Extract URL from multiple possible fields (PDF links, case URLs, etc.)
+    url = _first_field(metadata, src, _URL_KEYS)
+
+    # If no URL but we have a citation, try to construct CourtListener URL
+    if not url and citation:
+        url = _construct_courtlistener_url(citation)
+
+    # Cross-encoder scores are not probabilities. Clamp the legacy display
+    # value to the API's documented [0, 1] range before applying boosts.
+    display_score = min(max(float(raw_score), 0.0), 1.0)
+    if ctx.detected_state:
+        # Check if result is state-specific
+        court_lower = str(court).lower() if court else ""
+
+        # Boost if state keywords found in content, metadata, or court
+        state_boost = 0.0
+        state_re = _STATE_KEYWORD_RES[ctx.detected_state]
+        if state_re.search(content_lower) or state_re.search(metadata_lower) or state_re.search(court_lower):
+            state_boost = 0.15  # 15% boost for state-specific results
+
+        # Also check for state court patterns
+        if ctx.detected_state == 'florida' and ('fla.' in court_lower or 'dca' in court_lower or 'florida' in court_lower):
+            state_boost = 0.15
+        elif ctx.detected_state == 'california' and ('cal.' in court_lower or 'california' in court_lower):
+            state_boost = 0.15
+        elif ctx.detected_state == 'new york' and ('n.y.' in court_lower or 'new york' in court_lower):
+            state_boost = 0.15
+        elif ctx.detected_state == 'texas' and ('tex.' in court_lower or 'texas' in court_lower):
+            state_boost = 0.15
+
+        display_score = min(display_score + state_boost, 1.0)  # Cap at 1.0
+
+    # Boost for SaaS/software contract queries
+    if ctx.is_saas_query or ctx.is_contract_query:
+        contract_boost = 0.0
+        if ctx.is_saas_query:
+            # Boost if result contains SaaS-related terms
+            if _SAAS_RESULT_RE.search(content_lower) or _SAAS_RESULT_RE.search(metadata_lower):
+                contract_boost = 0.2  # 20% boost for SaaS-specific results
+        elif ctx.is_contract_query:
+            # Boost if result contains contract-related terms
+            if _CONTRACT_TERMS_RE.search(content_lower) or _CONTRACT_TERMS_RE.search(metadata_lower):
+                contract_boost = 0.1  # 10% boost for contract-related results
+
+        display_score = min(display_score + contract_boost, 1.0)  # Cap at 1.0
+
+    # If no court in metadata, try to extract from text (e.g., "11th Cir.", "Fla. 1st DCA")
+    if not court:
+        if content:
+            for pattern in _COURT_PATTERNS:
+                court_match = pattern.search(content_1000)
+                if court_match:
+                    court = court_match.group(1).strip()
+                    break
+
+    # Extract date from multiple possible fields
+    date = _first_field(metadata, src, _DATE_KEYS)
+
+    # If no date in metadata, try to extract from text (year in parentheses near citation)
+    if not date:
+        if content:
+            # Look for year pattern near citation (e.g., "(11th Cir. 2004)")
+            year_match = _YEAR_PAREN_RE.search(content_1000)
+            if year_match:
+                year = _YEAR_RE.search(year_match.group(0))
+                if year:
+                    date = year.group(0)
+
+    return {
+        "content": content,
+        "score": display_score,
+        "metadata": {
+            "title": title if title != 'Unknown' else (src_get('source') or 'Unknown'),
+            "collection": src_get('collection') or metadata.get('collection', 'unknown'),
+            "court": court,
+            "date": date,
+            "citation": citation,
+            "url": url
+        },
+        # Preserve extracted citations if available
+        "citations": src_get('citations', []),
+    }
+
+_score_of = operator.itemgetter('score')
+
 def _transform_sources_optimized(sources: list, query: str = "") -> list:
     """Optimized source transformation - minimize dict lookups"""
-    sources_list = []
-    MIN_SCORE_THRESHOLD = -0.5  # Filter out results with very negative scores
+    if not sources:
+        return []
 
     # Detect state in query for result boosting
-    state_keywords = {
-        'florida': ['florida', 'fl ', 'fl.', 'fla.', 'fla ', '1st dca', '2d dca', '3d dca', '4th dca', '5th dca', 'fla.'],
-        'california': ['california', 'ca ', 'cal.', 'cal '],
-        'new york': ['new york', 'ny ', 'n.y.'],
-        'texas': ['texas', 'tx ', 'tx.'],
-    }
     detected_state = None
     query_lower = query.lower() if query else ""
-    for state, keywords in state_keywords.items():
-        if any(keyword in query_lower for keyword in keywords):
+    for state, state_re in _STATE_KEYWORD_RES.items():
+        if state_re.search(query_lower):
             detected_state = state
             break
 
     # Improved filtering: remove truly off-topic results
     # This improves search relevance per our core principles
-    query_keywords = set(query.lower().split()) if query else set()
-
+    query_keywords = {word for word in _QUERY_WORD_RE.findall(query_lower) if word not in _STOPWORDS}
+    filter_off_topic = len(sources) > 2
     # Boost results for SaaS/software-specific queries
     # This improves search relevance when query mentions specific contract types
-    is_saas_query = any(term in query_lower for term in ['saas', 'software as a service', 'software contract', 'software license'])
-    is_contract_query = any(term in query_lower for term in ['contract', 'agreement', 'indemnity', 'indemnification', 'warranty'])
+    is_saas_query = _SAAS_QUERY_RE.search(query_lower) is not None
+    is_contract_query = _CONTRACT_TERMS_RE.search(query_lower) is not None
+
+    ctx = _SourceContext(
+        query_keywords=query_keywords,
+        detected_state=detected_state,
+        is_saas_query=is_saas_query,
+        is_contract_query=is_contract_query,
+        filter_off_topic=filter_off_topic,
+        match_text=bool(
+            (filter_off_topic and len(query_keywords) > 2)
+            or detected_state or is_saas_query or is_contract_query
+        ),
+    )
 
-    for src in sources:
-        raw_score = src.get('score', 0.0)
+    # Filter out results with very poor scores (unless it's the only result)
+    if len(sources) > 1:
+        sources = [src for src in sources if src.get('score', 0.0) >= _MIN_SCORE_THRESHOLD]
 
-        # Filter out results with very poor scores (unless it's the only result)
-        if raw_score < MIN_SCORE_THRESHOLD and len(sources) > 1:
-            continue
+    sources_list = [item for item in (_build_source(src, ctx) for src in sources) if item is not None]
 
-        # Additional relevance check: if query has specific keywords, check if result contains them
-        # This improves search relevance by filtering truly off-topic results
-        if query_keywords and len(query_keywords) > 2:  # Only if query has enough keywords
-            content_lower = (src.get('full_text') or src.get('text', '')).lower()
-            metadata_lower = str(src.get('metadata', {})).lower()
-
-            # Count how many query keywords appear in the result
-            keyword_matches = sum(1 for keyword in query_keywords if keyword in content_lower or keyword in metadata_lower)
-            keyword_ratio = keyword_matches / len(query_keywords)
-
-            # If less than 20% of keywords match and score is low, filter it out
-            if keyword_ratio < 0.2 and raw_score < 0.1 and len(sources) > 2:
-                continue
-
-        # Get metadata - it might be nested or at top level
-        metadata = src.get('metadata', {})
-        if not isinstance(metadata, dict):
-            metadata = {}
-
-        # Extract court before relevance boosting so jurisdiction-specific queries
-        # can safely use it. Full text fallback extraction happens below.
-        court = (
-            metadata.get('court') or
-            src.get('court') or
-            metadata.get('court_name') or
-            src.get('court_name') or
-            metadata.get('court_string') or
-            src.get('court_string') or
-            metadata.get('jurisdiction') or
-            src.get('jurisdiction') or
-            None
-        )
+    # Sort by boosted score (state-specific results first)
+    sources_list.sort(key=_score_of, reverse=True)
+    return sources_list
 
-        # Extract title from multiple possible locations (check both metadata and top-level)
-        title = (
-            metadata.get('case_name') or
-            src.get('case_name') or
-            metadata.get('title') or
-            src.get('title') or
-            metadata.get('filename') or
-            src.get('filename') or
-            metadata.get('name') or
-            src.get('name') or
-            src.get('source') or
-            None
-        )
+def _weak_etag(body: bytes) -> str:
+    """Weak validator for a cached body.
 
-        # If no title in metadata, try to extract from text content
-        if not title or title == 'Unknown':
-            content = src.get('full_text') or src.get('text', '')
-            if content:
-                # First, try to extract case name that appears before a citation
-                # Pattern: Case name followed by citation (e.g., "Hickson Corp. v. N. Crossarm Co., 357 F.3d 1256")
-                case_with_citation = re.search(
-                    r'([A-Z][^,]{10,120}?)\s*,\s*\d+\s+(?:F\.\s*(?:2d|3d|4th)?|U\.S\.|S\.\s*Ct\.|F\.\s*Supp\.)\s+\d+',
-                    content[:500],
-                    re.IGNORECASE
-                )
-                if case_with_citation:
-                    potential_title = case_with_citation.group(1).strip()
-                    # Clean up: remove trailing punctuation, ensure it looks like a case name
-                    potential_title = re.sub(r'[.,;]+$', '', potential_title)
-                    if len(potential_title) > 10 and len(potential_title) < 150:
-                        title = potential_title
-
-                # If that didn't work, look for case name patterns (e.g., "Plaintiff v. Defendant")
-                if not title or title == 'Unknown':
-                    case_name_match = re.search(
-                        r'([A-Z][^.,]{5,60}?)\s+(?:v\.?|vs\.?|versus)\s+([A-Z][^.,]{5,60}?)',
-                        content[:500],
-                        re.IGNORECASE
-                    )
-                    if case_name_match:
-                        title = f"{case_name_match.group(1).strip()} v. {case_name_match.group(2).strip()}"
-
-                # If still no title, try to find a title-like line
-                if not title or title == 'Unknown':
-                    lines = content[:800].split('\n')
-                    for line in lines[:10]:  # Check first 10 lines
-                        line = line.strip()
-                        # Skip very short lines, lines that are all caps (often headers), and lines with citations
-                        if (len(line) > 15 and len(line) < 250 and
-                            not line.isupper() and
-                            not re.search(r'\d+\s+(?:U\.S\.|F\.\s*(?:2d|3d|4th)?|S\.\s*Ct\.)', line, re.IGNORECASE)):
-                            # Check if it looks like a case name or document title
-                            if re.search(r'[A-Z][a-z]+', line):  # Has mixed case
-                                title = line
-                                break
-
-        # If still no title, try to clean up filename
-        if not title or title == 'Unknown':
-            filename = metadata.get('filename') or src.get('filename') or src.get('source')
-            if filename:
-                # Clean up filename: remove extensions, underscores, dates
-                title = filename
-                # Remove common file extensions
-                title = re.sub(r'\.(pdf|txt|docx?)$', '', title, flags=re.IGNORECASE)
-                # Replace underscores and hyphens with spaces
-                title = re.sub(r'[_-]', ' ', title)
-                # Remove date patterns (YYYYMMDD, YYYY-MM-DD, etc.)
-                title = re.sub(r'\d{4}[-_]?\d{2}[-_]?\d{2}', '', title)
-                # Remove common prefixes like "EX-99.1_", "8-K_", etc.
-                title = re.sub(r'^(?:EX-\d+\.\d+_|8-K_|EX-\d+_)', '', title, flags=re.IGNORECASE)
-                # Clean up multiple spaces
-                title = re.sub(r'\s+', ' ', title).strip()
-                # Capitalize first letter of each word for readability
-                if title:
-                    title = ' '.join(word.capitalize() if word.islower() else word for word in title.split())
-
-        # Final fallback
-        if not title:
-            title = 'Unknown'
-
-        # Extract ALL citations from text (not just the first one)
-        # This improves citation usefulness per our core principles
-        all_citations = []
-        content = src.get('full_text') or src.get('text', '')
-
-        # First, check metadata for citation
-        citation = (
-            metadata.get('citation') or
-            src.get('citation') or
-            metadata.get('case_citation') or
-            src.get('case_citation') or
-            metadata.get('citation_string') or
-            src.get('citation_string') or
-            None
-        )
+    Each response appends the caller's own searches_remaining, so bodies
+    sharing this tag are equivalent but not byte-identical.
+    """
+    return f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
 
-        if citation:
-            all_citations.append(citation)
 
-        # Extract all citations from text content (up to first 3000 chars for performance)
-        if content:
-            # Comprehensive citation patterns
-            citation_patterns = [
-                # Federal Reporter with series (F.2d, F.3d, F.4th) - handles "357 F.3d 1256"
-                r'\d+\s+F\.\s*(?:2d|3d|4th)?\s+\d+',
-                # U.S. Reports
-                r'\d+\s+U\.S\.(?:\s+App\.)?\s+\d+',
-                # Supreme Court
-                r'\d+\s+S\.\s*Ct\.\s+\d+',
-                # Federal Supplement
-                r'\d+\s+F\.\s*Supp\.\s*(?:2d|3d)?\s+\d+',
-                # State reporters
-                r'\d+\s+(?:Cal\.|Cal\.\s*App\.|Cal\.\s*Rptr\.)\s+\d+',  # California
-                r'\d+\s+(?:N\.Y\.|N\.Y\.\s*App\.)\s+\d+',  # New York
-                r'\d+\s+(?:Del\.|Del\.\s*Ch\.)\s+\d+',  # Delaware
-                r'\d+\s+(?:Fla\.|Fla\.\s*App\.)\s+\d+',  # Florida
-                r'\d+\s+(?:Tex\.|Tex\.\s*App\.)\s+\d+',  # Texas
-            ]
-
-            # Find all citations in the text
-            found_citations = set()  # Use set to avoid duplicates
-            for pattern in citation_patterns:
-                matches = re.finditer(pattern, content[:3000], re.IGNORECASE)
-                for match in matches:
-                    cit = match.group(0).strip()
-                    # Clean up citation (remove extra spaces)
-                    cit = re.sub(r'\s+', ' ', cit)
-                    if cit not in found_citations:
-                        found_citations.add(cit)
-                        all_citations.append(cit)
-
-            # If we found citations, use the first one as primary, but keep all
-            if all_citations and not citation:
-                citation = all_citations[0]
-
-        # Extract URL from multiple possible fields (PDF links, case URLs, etc.)
-        url = (
-            metadata.get('url') or
-            src.get('url') or
-            metadata.get('case_url') or
-            src.get('case_url') or
-            metadata.get('pdf_url') or
-            src.get('pdf_url') or
-            metadata.get('download_url') or
-            src.get('download_url') or
-            metadata.get('resource_uri') or
-            src.get('resource_uri') or
-            metadata.get('absolute_url') or
-            src.get('absolute_url') or
-            metadata.get('link') or
-            src.get('link') or
-            None
-        )
+def _encode_search(answer: str, sources_list: list, metadata: dict) -> _CachedSearch:
+    """Encode the user-independent part of a search response once."""
+    body = orjson.dumps({"answer": answer, "sources": sources_list})[:-1]
+    return _CachedSearch(body, _weak_etag(body), metadata, len(sources_list))
 
-        # If no URL but we have a citation, try to construct CourtListener URL
-        if not url and citation:
-            url = _construct_courtlistener_url(citation)
-
-        # Cross-encoder scores are not probabilities. Clamp the legacy display
-        # value to the API's documented [0, 1] range before applying boosts.
-        display_score = min(max(float(raw_score), 0.0), 1.0)
-        if detected_state:
-            # Check if result is state-specific
-            content_lower = (src.get('full_text') or src.get('text', '')).lower()
-            metadata_lower = str(metadata).lower()
-            court_lower = str(court).lower() if court else ""
-
-            # Boost if state keywords found in content, metadata, or court
-            state_boost = 0.0
-            for keyword in state_keywords.get(detected_state, []):
-                if keyword in content_lower or keyword in metadata_lower or keyword in court_lower:
-                    state_boost = 0.15  # 15% boost for state-specific results
-                    break
 
-            # Also check for state court patterns
-            if detected_state == 'florida' and ('fla.' in court_lower or 'dca' in court_lower or 'florida' in court_lower):
-                state_boost = 0.15
-            elif detected_state == 'california' and ('cal.' in court_lower or 'california' in court_lower):
-                state_boost = 0.15
-            elif detected_state == 'new york' and ('n.y.' in court_lower or 'new york' in court_lower):
-                state_boost = 0.15
-            elif detected_state == 'texas' and ('tex.' in court_lower or 'texas' in court_lower):
-                state_boost = 0.15
-
-            display_score = min(display_score + state_boost, 1.0)  # Cap at 1.0
-
-        # Boost for SaaS/software contract queries
-        if is_saas_query or is_contract_query:
-            content_lower = (src.get('full_text') or src.get('text', '')).lower()
-            metadata_lower = str(metadata).lower()
-
-            # Check for SaaS/software-related terms
-            saas_terms = ['saas', 'software as a service', 'software license', 'subscription', 'software agreement']
-            contract_terms = ['contract', 'agreement', 'indemnity', 'indemnification', 'warranty']
-
-            contract_boost = 0.0
-            if is_saas_query:
-                # Boost if result contains SaaS-related terms
-                if any(term in content_lower or term in metadata_lower for term in saas_terms):
-                    contract_boost = 0.2  # 20% boost for SaaS-specific results
-            elif is_contract_query:
-                # Boost if result contains contract-related terms
-                if any(term in content_lower or term in metadata_lower for term in contract_terms):
-                    contract_boost = 0.1  # 10% boost for contract-related results
-
-            display_score = min(display_score + contract_boost, 1.0)  # Cap at 1.0
-
-        # If no court in metadata, try to extract from text (e.g., "11th Cir.", "Fla. 1st DCA")
-        if not court:
-            content = src.get('full_text') or src.get('text', '')
-            if content:
-                # Look for court patterns near citations (e.g., "(11th Cir. 2004)")
-                court_patterns = [
-                    r'\((\d+(?:st|nd|rd|th)?\s*(?:Cir\.|D\.C\.|D\.\s*C\.))',  # "11th Cir.", "1st D.C."
-                    r'\((Fla\.\s*(?:1st|2d|3d|4th|5th)?\s*DCA?)',  # "Fla. 1st DCA"
-                    r'\((Cal\.\s*(?:App\.|Sup\.\s*Ct\.))',  # "Cal. App."
-                    r'\((N\.Y\.\s*(?:App\.|Sup\.\s*Ct\.))',  # "N.Y. App."
-                ]
-                for pattern in court_patterns:
-                    court_match = re.search(pattern, content[:1000], re.IGNORECASE)
-                    if court_match:
-                        court = court_match.group(1).strip()
-                        break
-
-        # Extract date from multiple possible fields
-        date = (
-            metadata.get('date') or
-            src.get('date') or
-            metadata.get('date_filed') or
-            src.get('date_filed') or
-            metadata.get('filing_date') or
-            src.get('filing_date') or
-            metadata.get('date_created') or
-            src.get('date_created') or
-            metadata.get('date_decided') or
-            src.get('date_decided') or
-            None
-        )
+def _search_response(cached: _CachedSearch, searches_remaining: int, cache_status: str) -> Response:
+    """Build a response that browsers and shared CDNs must not persist."""
+    metadata = {**cached.metadata, "searches_remaining": searches_remaining}
+    return Response(
+        content=cached.body + b',"metadata":' + orjson.dumps(metadata) + b"}",
+        media_type="application/json",
+        headers={
+            "Cache-Control": "private, no-store",
+            "Pragma": "no-cache",
+            "ETag": cached.etag,
+            "X-Cache-Status": cache_status,
+        },
+    )
 
-        # If no date in metadata, try to extract from text (year in parentheses near citation)
-        if not date:
-            content = src.get('full_text') or src.get('text', '')
-            if content:
-                # Look for year pattern near citation (e.g., "(11th Cir. 2004)")
-                year_match = re.search(r'\([^)]*(?:19|20)\d{2}\)', content[:1000])
-                if year_match:
-                    year = re.search(r'(19|20)\d{2}', year_match.group(0))
-                    if year:
-                        date = year.group(0)
-
-        sources_list.append({
-            "content": src.get('full_text') or src.get('text', ''),
-            "score": display_score,
-            "metadata": {
-                "title": title if title != 'Unknown' else (src.get('source') or 'Unknown'),
-                "collection": src.get('collection') or metadata.get('collection', 'unknown'),
-                "court": court,
-                "date": date,
-                "citation": citation,
-                "url": url
-            },
-            # Preserve extracted citations if available
-            "citations": src.get('citations', []),
-            # Store raw score for sorting
-            "_sort_score": display_score
-        })
 
-    # Sort by boosted score (state-specific results first)
-    sources_list.sort(key=lambda x: x.get('_sort_score', 0), reverse=True)
+def _ask_kwargs(search_request: SearchRequest, stream: bool = False) -> dict:
+    """Map a SearchRequest onto LegalRAGEngine.ask keyword arguments."""
+    return dict(
+        query=search_request.query,
+        collection_type=search_request.collection,
+        limit=search_request.limit,
+        return_sources=True,
+        stream=stream,
+        filters=None,
+        use_hybrid=search_request.use_hybrid,
+        use_reranking=search_request.use_reranking,
+        extract_citations=search_request.extract_citations,
+    )
 
-    # Remove internal sort key before returning
-    for src in sources_list:
-        src.pop('_sort_score', None)
 
-    return sources_list
+async def _run_rag(app_state, ask_kwargs: dict) -> dict:
+    """Run rag_engine.ask off the event loop, through the batcher when configured."""
+    batcher = getattr(app_state, "search_batcher", None)
+    async with _rag_slots:
+        if batcher is not None:
+            return await batcher.submit(**ask_kwargs)
+        return await asyncio.to_thread(functools.partial(app_state.rag_engine.ask, **ask_kwargs))
+
+
+def _sse_events(answer, head: dict):
+    """Yield server-sent events: sources first, then answer tokens, then [DONE]."""
+    yield b"data: " + orjson.dumps(head) + b"\n\n"
+    # Gemini streaming yields text chunks; fallbacks and "no results" are strings
+    tokens = (answer,) if isinstance(answer, str) else answer
+    for token in tokens:
+        if token:
+            yield b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+    yield b"data: [DONE]\n\n"
 
-def _search_response(response: SearchResponse, cache_status: str) -> JSONResponse:
-    """Build a response that browsers and shared CDNs must not persist."""
-    json_response = JSONResponse(content=response.model_dump())
-    json_response.headers["Cache-Control"] = "private, no-store"
-    json_response.headers["Pragma"] = "no-cache"
-    json_response.headers["X-Cache-Status"] = cache_status
-    return json_response
+
+async def _stream_search(
+    app_state, search_request: SearchRequest, searches_remaining: int
+) -> tuple[StreamingResponse, int]:
+    """Run retrieval, then stream the answer so the client can render tokens early.
+
+    Streamed searches bypass the response cache; only retrieval runs before
+    the first byte is sent.
+    """
+    results = await _run_rag(app_state, _ask_kwargs(search_request, stream=True))
+
+    sources_list = _transform_sources_optimized(results.get("sources", []), search_request.query)
+    head = {
+        "sources": sources_list,
+        "metadata": {
+            "total_searched": results.get("num_sources", 0),
+            "query_time": results.get("search_time", 0),
+            "collection": search_request.collection,
+            "searches_remaining": searches_remaining,
+        },
+    }
+    # Sync generator: Starlette iterates it in the threadpool, so blocking
+    # Gemini chunk reads stay off the event loop.
+    return StreamingResponse(
+        _sse_events(results.get("answer", "No answer generated"), head),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "private, no-store",
+            "Pragma": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    ), len(sources_list)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_search_request(body: bytes) -> SearchRequest:
+    """Validate a /search body; identical re-submissions reuse the model."""
+    return SearchRequest.model_validate_json(body)
+
+
+async def _search_request_body(request: Request) -> SearchRequest:
+    """Parse the raw request body through the validation cache.
+
+    Errors are re-raised as RequestValidationError so clients still get
+    FastAPI's standard 422 body.
+    """
+    try:
+        return _parse_search_request(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        ) from exc
 
 
 def _record_search(
-    db: Session,
-    user: auth_models.User,
+    bind,
+    user_id: int,
     request: SearchRequest,
     result_count: int,
 ) -> None:
-    db.add(
-        auth_models.SearchHistory(
-            user_id=user.id,
-            query=request.query,
-            collection=request.collection,
-            result_count=result_count,
-        )
+    """Write a search history row in its own session.
+
+    Runs as a background task after the response is sent; usage was
+    already counted atomically by reserve_search.
+    """
+    try:
+        with Session(bind) as db:
+            db.add(
+                auth_models.SearchHistory(
+                    user_id=user_id,
+                    query=request.query,
+                    collection=request.collection,
+                    result_count=result_count,
+                )
+            )
+            db.commit()
+    except Exception:
+        logger.exception("Failed to record search history for user_id=%s", user_id)
+
+
+async def _embed_query(app_state, query: str) -> Optional[list]:
+    """Embed a query for the semantic cache, batched when a batcher is running."""
+    rag_engine = app_state.rag_engine
+    if not hasattr(rag_engine, "encode_queries"):
+        return None
+    batcher = getattr(app_state, "search_batcher", None)
+    try:
+        if batcher is not None:
+            return await batcher.encode(query)
+        return (await asyncio.to_thread(rag_engine.encode_queries, [query]))[0]
+    except Exception:
+        # The semantic cache is an optimization; ask() embeds on its own
+        logger.exception("Query embedding for semantic cache failed")
+        return None
+
+
+async def _execute_search(
+    app_state, search_request: SearchRequest, query_vector: Optional[list] = None
+) -> _CachedSearch:
+    """Run the RAG pipeline for a cache miss and cache the encoded result."""
+    logger.info("Executing legal search")
+    request_start = time.perf_counter()
+    ask_kwargs = _ask_kwargs(search_request)
+    if query_vector is not None:
+        ask_kwargs["query_vector"] = query_vector
+    results = await _run_rag(app_state, ask_kwargs)
+
+    request_time = time.perf_counter() - request_start
+    search_time = results.get("search_time", 0)
+    generation_time = results.get("generation_time", 0)
+    sources_list = _transform_sources_optimized(results.get("sources", []), search_request.query)
+    cached = _encode_search(
+        results.get("answer", "No answer generated"),
+        sources_list,
+        {
+            "total_searched": results.get("num_sources", 0),
+            "query_time": search_time + generation_time,
+            "collection": search_request.collection,
+        },
     )
-    db.commit()
+    _cache_put(_create_cache_key(search_request), cached, query_vector)
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Search completed: %s sources | total %.2fs | search %.2fs | generation %.2fs",
+            cached.result_count,
+            request_time,
+            search_time,
+            generation_time,
+        )
+    return cached
+
+
+def load_warmup_queries(path: Path, limit: int) -> list:
+    """Read up to ``limit`` warmup searches (SearchRequest fields) from JSON."""
+    if limit <= 0 or not path.exists():
+        return []
+    return [SearchRequest.model_validate(item) for item in orjson.loads(path.read_bytes())[:limit]]
+
+
+async def warm_search_cache(app_state, search_requests: list) -> int:
+    """Run searches into the cache before serving traffic; returns entries added."""
+    warmed = 0
+    for search_request in search_requests:
+        key = _create_cache_key(search_request)
+        if key in _query_cache or key in _hot_cache:  # Not a user hit; don't count it
+            continue
+        try:
+            query_vector = await _embed_query(app_state, search_request.query)
+            await _execute_search(app_state, search_request, query_vector)
+            warmed += 1
+        except Exception:
+            logger.exception("Cache warmup search failed")
+    return warmed
+
+
+def save_search_cache(path: Path) -> int:
+    """Persist the encoded search cache so the next process starts warm."""
+    with _cache_lock:
+        entries = [
+            {
+                "key": list(key),
+                "body": base64.b64encode(cached.body).decode("ascii"),
+                "etag": cached.etag,
+                "metadata": cached.metadata,
+                "result_count": cached.result_count,
+            }
+            # Hot entries last so they survive load_search_cache's truncation
+            for key, cached in (*_query_cache.items(), *_hot_cache.items())
+        ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Every worker saves on shutdown: write a private file and rename it into
+    # place, so the last writer wins and readers never see a torn file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(orjson.dumps(entries))
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+def load_search_cache(path: Path) -> int:
+    """Reload a cache written by save_search_cache; returns entries loaded."""
+    if not path.exists():
+        return 0
+    entries = orjson.loads(path.read_bytes())[-_cache_max_size:]
+    for entry in entries:
+        body = base64.b64decode(entry["body"])
+        _cache_put(
+            tuple(entry["key"]),
+            # Recomputed: files from older releases carry strong ETags
+            _CachedSearch(body, _weak_etag(body), entry["metadata"], entry["result_count"]),
+        )
+    return len(entries)
+
+
+async def _wait_for_rag_engine(app_state) -> None:
+    """Hold a search until the background engine load has finished."""
+    loaded = getattr(app_state, "rag_engine_loaded", None)
+    if loaded is None or loaded.is_set():
+        return
+    try:
+        await asyncio.wait_for(loaded.wait(), timeout=RAG_READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Search is starting up. Please try again shortly.",
+            headers={"Retry-After": "10"},
+        )
+
+
+async def _single_flight(key: tuple, run) -> tuple[_CachedSearch, bool]:
+    """Run ``run()`` once per key; concurrent callers await the same result.
+
+    Returns the result and whether this caller joined an in-flight search.
+    Only the event loop touches ``_inflight``, so no lock is needed.
+    """
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        logger.info("Joining in-flight search")
+        return await asyncio.shield(inflight), True
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await run()
+    except BaseException as exc:
+        # Joiners must see an ordinary error, not CancelledError, so the
+        # caller's except-Exception path refunds their reserved search
+        if isinstance(exc, asyncio.CancelledError):
+            exc = RuntimeError("Search cancelled before it completed")
+        future.set_exception(exc)
+        future.exception()  # Mark retrieved when nobody joined
+        raise
+    else:
+        future.set_result(result)
+        return result, False
+    finally:
+        _inflight.pop(key, None)
 
 
 @router.post(
     "/search",
-    response_model=SearchResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": SearchRequest.model_json_schema()}},
+        }
+    },
     responses={
+        200: {"model": SearchResponse, "description": "Search answer and sources"},
         403: {"description": "Free search limit reached"},
         500: {"model": ErrorResponse, "description": "Internal server error"},
     },
 )
 @limiter.limit("20/minute")
 async def search(
-    search_request: SearchRequest,
     request: Request,
+    background_tasks: BackgroundTasks,
+    search_request: SearchRequest = Depends(_search_request_body),
     current_user: auth_models.User = Depends(security.get_current_active_user),
     db: Session = Depends(get_db),
 ):
-    """Run an authenticated legal search and account for it server-side."""
+    """Run an authenticated legal search and account for it server-side.
+
+    The auth session is synchronous, so its writes run on worker threads to
+    keep the event loop free for other requests.
+    """
     reserved = False
     try:
+        await _wait_for_rag_engine(request.app.state)
         if not getattr(request.app.state, "rag_engine", None):
             raise HTTPException(status_code=500, detail="RAG engine not initialized")
 
-        allowed, searches_remaining = security.reserve_search(db, current_user)
+        allowed, searches_remaining = await asyncio.to_thread(security.reserve_search, db, current_user)
         if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Free search limit reached. Upgrade to Pro for unlimited searches!",
             )
-        reserved = current_user.tier == "free"
+        reserved = current_user.tier == auth_models.TIER_FREE
+
+        if search_request.stream:
+            response, result_count = await _stream_search(request.app.state, search_request, searches_remaining)
+            background_tasks.add_task(_record_search, db.get_bind(), current_user.id, search_request, result_count)
+            return response
 
-        rag_engine = request.app.state.rag_engine
-        request_start = time.time()
         cache_key = _create_cache_key(search_request)
 
-        if cache_key in _query_cache:
+        cached = _cache_get(cache_key)
+        if cached is not None:
             logger.info("Search cache hit")
-            response = _query_cache.pop(cache_key)
-            _query_cache[cache_key] = response
-            response.metadata["searches_remaining"] = searches_remaining
-            _record_search(db, current_user, search_request, len(response.sources))
-            return _search_response(response, "HIT")
-
-        logger.info("Executing legal search")
-        loop = asyncio.get_running_loop()
-        results = await loop.run_in_executor(
-            _executor,
-            rag_engine.ask,
-            search_request.query,
-            search_request.collection,
-            search_request.limit,
-            True,
-            False,
-            None,
-            search_request.use_hybrid,
-            search_request.use_reranking,
-            search_request.extract_citations,
-        )
-
-        request_time = time.time() - request_start
-        sources_list = _transform_sources_optimized(results.get("sources", []), search_request.query)
-        response = SearchResponse(
-            answer=results.get("answer", "No answer generated"),
-            sources=sources_list,
-            metadata={
-                "total_searched": results.get("num_sources", 0),
-                "query_time": results.get("search_time", 0) + results.get("generation_time", 0),
-                "collection": search_request.collection,
-                "searches_remaining": searches_remaining,
-            },
-        )
-
-        if len(_query_cache) >= _cache_max_size:
-            _query_cache.pop(next(iter(_query_cache)))
-        _query_cache[cache_key] = response
-        _record_search(db, current_user, search_request, len(sources_list))
-
-        logger.info(
-            "Search completed: %s sources | total %.2fs | search %.2fs | generation %.2fs",
-            len(sources_list),
-            request_time,
-            results.get("search_time", 0),
-            results.get("generation_time", 0),
+            background_tasks.add_task(_record_search, db.get_bind(), current_user.id, search_request, cached.result_count)
+            return _search_response(cached, searches_remaining, "HIT")
+
+        query_vector = await _embed_query(request.app.state, search_request.query)
+        # An identical search may have finished (and left _inflight) while
+        # the embedding waited in the batcher
+        cached = _cache_get(cache_key)
+        if cached is None and query_vector is not None:
+            cached = _cache_get_similar(cache_key, query_vector)
+        if cached is not None:
+            logger.info("Search cache hit after embedding")
+            background_tasks.add_task(_record_search, db.get_bind(), current_user.id, search_request, cached.result_count)
+            return _search_response(cached, searches_remaining, "HIT")
+
+        cached, joined = await _single_flight(
+            cache_key, lambda: _execute_search(request.app.state, search_request, query_vector)
         )
-        return _search_response(response, "MISS")
+        background_tasks.add_task(_record_search, db.get_bind(), current_user.id, search_request, cached.result_count)
+        return _search_response(cached, searches_remaining, "HIT" if joined else "MISS")
 
     except HTTPException:
         if reserved:
             db.rollback()
-            security.refund_search(db, current_user)
+            await asyncio.to_thread(security.refund_search, db, current_user)
         raise
     except Exception:
         db.rollback()
         if reserved:
             try:
-                security.refund_search(db, current_user)
+                await asyncio.to_thread(security.refund_search, db, current_user)
             except Exception:
                 logger.exception("Failed to refund reserved search for user_id=%s", current_user.id)
         logger.exception("Search failed for user_id=%s", current_user.id)
@@ -0,0 +1,27 @@
+"""Second-resolution UTC clock shared by the auth hot paths"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+
+TICK_SECONDS = 1.0
+
+_now: Optional[datetime] = None
+
+def now() -> datetime:
+    """Naive UTC time like ``datetime.utcnow()``, refreshed once per tick.
+
+    Login times, token expiry and the admin stats windows only need
+    second resolution. Until ``tick()`` is running (tests, scripts) this
+    reads the system clock directly.
+    """
+    return _now if _now is not None else datetime.utcnow()
+
+async def tick(interval: float = TICK_SECONDS) -> None:
+    """Refresh the cached time until cancelled (started by the app lifespan)."""
+    global _now
+    try:
+        while True:
+            _now = datetime.utcnow()
+            await asyncio.sleep(interval)
+    finally:
+        _now = None
@@ -1,5 +1,5 @@
 """Database configuration for SQLite"""
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
@@ -27,6 +27,25 @@ engine = create_engine(
     pool_pre_ping=True,
 )
 
+# SQLite tuning applied to every new connection: WAL lets searches read while
+# usage counters are written, and synchronous=NORMAL is durable under WAL
+# without an fsync per commit.
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "mmap_size=268435456",
+    "cache_size=-64000",
+)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -42,6 +61,11 @@ def init_db():
     """Initialize database tables"""
     try:
         Base.metadata.create_all(bind=engine)
+        # create_all skips tables that already exist, so add any indexes
+        # introduced since an existing database was created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
     except Exception as e:
         # If tables already exist, that's fine - just log and continue
         # This can happen on container restarts
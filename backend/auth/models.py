@@ -1,9 +1,17 @@
 """SQLAlchemy models for authentication"""
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, case
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# Tiers stay strings: they are the API's wire values and what existing
+# databases already hold (init_db only creates, it never migrates columns)
+TIER_FREE = "free"
+TIER_PRO = "pro"
+
+FREE_TIER_LIMIT = 15
+
 class User(Base):
     __tablename__ = "users"
 
@@ -11,11 +19,11 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=True)  # Nullable for OAuth users
     full_name = Column(String)
-    tier = Column(String, default="free")
+    tier = Column(String, default=TIER_FREE)
     search_count = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    last_login = Column(DateTime(timezone=True), onupdate=func.now())
+    last_login = Column(DateTime(timezone=True), nullable=True)  # Set explicitly on login
     
     # OAuth fields
     google_id = Column(String, unique=True, nullable=True, index=True)
@@ -25,8 +33,24 @@ class User(Base):
     
     searches = relationship("SearchHistory", back_populates="user")
 
+    @hybrid_property
+    def searches_remaining(self):
+        """Free searches left, or -1 for unlimited tiers"""
+        return FREE_TIER_LIMIT - self.search_count if self.tier == TIER_FREE else -1
+
+    @searches_remaining.inplace.expression
+    @classmethod
+    def _searches_remaining_expression(cls):
+        return case((cls.tier == TIER_FREE, FREE_TIER_LIMIT - cls.search_count), else_=-1)
+
 class SearchHistory(Base):
     __tablename__ = "search_history"
+    __table_args__ = (
+        # For the planned per-user search history listing (WHERE user_id = ?
+        # ORDER BY timestamp DESC). Nothing reads history by user yet, so
+        # until then this only adds a little write cost per search.
+        Index("ix_search_history_user_ts", "user_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
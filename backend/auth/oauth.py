@@ -2,7 +2,8 @@
 from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 from sqlalchemy.orm import Session
-from . import models, security
+from . import schemas, security
+import asyncio
 import os
 import secrets
 import logging
@@ -32,6 +33,18 @@ def get_oauth():
     """Get OAuth instance"""
     return oauth
 
+async def preload_google_metadata():
+    """Fetch Google's OpenID configuration and JWKS before the first callback.
+
+    Authlib keeps both for the life of the process (refetching the JWKS only
+    when an id_token names an unknown key), so this moves the two HTTPS
+    round trips from the first user's login to startup.
+    """
+    if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
+        return
+    await oauth.google.load_server_metadata()
+    await oauth.google.fetch_jwk_set()
+
 async def google_login(request: Request):
     """Initiate Google OAuth login"""
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
@@ -52,7 +65,7 @@ async def google_login(request: Request):
         # Fallback to request URL (may not work behind proxy)
         redirect_uri = str(request.url_for('google_callback'))
     
-    logger.info(f"OAuth redirect URI: {redirect_uri}")
+    logger.info("OAuth redirect URI: %s", redirect_uri)
     return await oauth.google.authorize_redirect(request, redirect_uri, state=state)
 
 async def google_callback(request: Request, db: Session):
@@ -85,39 +98,14 @@ async def google_callback(request: Request, db: Session):
     if not email:
         raise Exception("Email not provided by Google")
     
-    # Check if user exists by email or google_id
-    user = db.query(models.User).filter(
-        (models.User.email == email) | (models.User.google_id == google_id)
-    ).first()
-    
-    if user:
-        # Update existing user with OAuth info if needed
-        if not user.google_id:
-            user.google_id = google_id
-            user.oauth_provider = 'google'
-        if profile_picture and not user.profile_picture:
-            user.profile_picture = profile_picture
-        if full_name and not user.full_name:
-            user.full_name = full_name
-        from datetime import datetime
-        user.last_login = datetime.utcnow()
-        db.commit()
-        db.refresh(user)
-    else:
-        # Create new user from OAuth
-        from datetime import datetime
-        user = models.User(
-            email=email,
-            full_name=full_name,
-            google_id=google_id,
-            oauth_provider='google',
-            profile_picture=profile_picture,
-            hashed_password=None,  # OAuth users don't have passwords
-            last_login=datetime.utcnow()
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    user = await asyncio.to_thread(
+        security.upsert_google_user,
+        db,
+        email=email,
+        google_id=google_id,
+        full_name=full_name,
+        profile_picture=profile_picture,
+    )
     
     # Create JWT token (same as email/password login)
     access_token = security.create_access_token(data={"sub": user.email})
@@ -125,17 +113,6 @@ async def google_callback(request: Request, db: Session):
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": {
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "tier": user.tier,
-            "search_count": user.search_count,
-            "searches_remaining": security.FREE_TIER_LIMIT - user.search_count if user.tier == "free" else -1,
-            "is_active": user.is_active,
-            "created_at": user.created_at,
-            "last_login": user.last_login,
-            "profile_picture": user.profile_picture
-        }
+        "user": schemas.UserResponse.model_validate(user),
     }
 
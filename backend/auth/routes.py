@@ -1,28 +1,75 @@
 """FastAPI routes for authentication"""
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from pydantic import ValidationError
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from datetime import datetime
-from starlette.middleware.sessions import SessionMiddleware
-from . import models, schemas, security
+from . import clock, models, schemas, security
 from .database import get_db
 from limiter import limiter
+from functools import lru_cache
+import importlib.util
 import os
 
-# Optional OAuth import (only if oauth.py exists)
-try:
+# Google OAuth routes need Authlib and a configured client. Checked without
+# importing, so workers that never serve OAuth skip the Authlib/httpx import.
+OAUTH_AVAILABLE = importlib.util.find_spec("authlib") is not None and bool(os.getenv("GOOGLE_CLIENT_ID"))
+
+
+@lru_cache(maxsize=None)
+def _get_oauth():
+    """Import the OAuth module (and register the Google client) on first use"""
     from . import oauth
-    OAUTH_AVAILABLE = True
-except ImportError:
-    OAUTH_AVAILABLE = False
-    oauth = None
+    return oauth
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
-@router.post("/register", response_model=schemas.Token, status_code=status.HTTP_201_CREATED)
+_USER_RESPONSE_FIELDS = tuple(schemas.UserResponse.model_fields)
+
+
+def _user_payload(user: models.User, **overrides) -> dict:
+    """UserResponse fields read straight off the ORM row.
+
+    The hot auth endpoints return this through ORJSONResponse: every value is
+    already typed by the database, so validating it again as a response_model
+    only costs time. The decorators keep response_model for the OpenAPI docs.
+    """
+    payload = {name: getattr(user, name) for name in _USER_RESPONSE_FIELDS}
+    payload.update(overrides)
+    return payload
+
+async def _user_create_body(request: Request) -> schemas.UserCreate:
+    """Validate the raw /register body in one pydantic-core pass.
+
+    Skips FastAPI's json.loads-then-validate round trip; errors still come
+    back as FastAPI's standard 422 body.
+    """
+    try:
+        return schemas.UserCreate.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        ) from exc
+
+@router.post(
+    "/register",
+    response_model=schemas.Token,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schemas.UserCreate.model_json_schema()}},
+        }
+    },
+)
 @limiter.limit("10/minute")
-async def register(request: Request, user_create: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(
+    request: Request,
+    user_create: schemas.UserCreate = Depends(_user_create_body),
+    db: Session = Depends(get_db),
+):
     db_user = security.get_user_by_email(db, email=user_create.email)
     if db_user:
         raise HTTPException(
@@ -43,28 +90,16 @@ async def register(request: Request, user_create: schemas.UserCreate, db: Sessio
     
     access_token = security.create_access_token(data={"sub": db_user.email})
     
-    user_response = schemas.UserResponse(
-        id=db_user.id,
-        email=db_user.email,
-        full_name=db_user.full_name,
-        tier=db_user.tier,
-        search_count=db_user.search_count,
-        searches_remaining=security.FREE_TIER_LIMIT,
-        is_active=db_user.is_active,
-        created_at=db_user.created_at,
-        last_login=db_user.last_login
-    )
-    
-    return schemas.Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user_response
+    return ORJSONResponse(
+        {"access_token": access_token, "token_type": "bearer", "user": _user_payload(db_user)},
+        status_code=status.HTTP_201_CREATED,
     )
 
 @router.post("/login", response_model=schemas.Token)
 @limiter.limit("10/minute")
-async def login(
+def login(
     request: Request,
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -76,47 +111,25 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Written after the response is sent, without an ORM flush/refresh
+    logged_in_at = clock.now()
+    if security.last_login_is_current(user.last_login, logged_in_at):
+        # The write would be skipped; report the stored value, as /me does
+        logged_in_at = user.last_login
+    else:
+        background_tasks.add_task(security.touch_last_login, db.get_bind(), user.id, logged_in_at)
     
     access_token = security.create_access_token(data={"sub": user.email})
-    searches_remaining = security.FREE_TIER_LIMIT - user.search_count if user.tier == "free" else -1
-    
-    user_response = schemas.UserResponse(
-        id=user.id,
-        email=user.email,
-        full_name=user.full_name,
-        tier=user.tier,
-        search_count=user.search_count,
-        searches_remaining=searches_remaining,
-        is_active=user.is_active,
-        created_at=user.created_at,
-        last_login=user.last_login,
-        profile_picture=user.profile_picture
-    )
     
-    return schemas.Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user_response
-    )
+    return ORJSONResponse({
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": _user_payload(user, last_login=logged_in_at),
+    })
 
 @router.get("/me", response_model=schemas.UserResponse)
 async def read_users_me(current_user: models.User = Depends(security.get_current_active_user)):
-    searches_remaining = security.FREE_TIER_LIMIT - current_user.search_count if current_user.tier == "free" else -1
-    
-    return schemas.UserResponse(
-        id=current_user.id,
-        email=current_user.email,
-        full_name=current_user.full_name,
-        tier=current_user.tier,
-        search_count=current_user.search_count,
-        searches_remaining=searches_remaining,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at,
-        last_login=current_user.last_login,
-        profile_picture=current_user.profile_picture
-    )
+    return ORJSONResponse(_user_payload(current_user))
 
 @router.get("/search/check-limit", response_model=schemas.SearchLimitResponse)
 async def check_search_limit(
@@ -150,7 +163,7 @@ async def track_search(
     """
     searches_remaining = (
         max(security.FREE_TIER_LIMIT - current_user.search_count, 0)
-        if current_user.tier == "free"
+        if current_user.tier == models.TIER_FREE
         else -1
     )
     return {
@@ -160,22 +173,27 @@ async def track_search(
     }
 
 @router.post("/admin/upgrade-user")
-async def upgrade_user_to_pro(
-    email: str,
+def upgrade_user_to_pro(
+    upgrade: schemas.UpgradeUserRequest,
     db: Session = Depends(get_db),
     _admin: models.User = Depends(security.require_admin),
 ):
-    user = security.get_user_by_email(db, email)
-    if not user:
+    # One UPDATE ... RETURNING instead of SELECT, then UPDATE on flush
+    upgraded = db.execute(
+        update(models.User)
+        .where(models.User.email == upgrade.email)
+        .values(tier=models.TIER_PRO)
+        .returning(models.User.id)
+    ).first()
+    if upgraded is None:
+        db.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
-    user.tier = "pro"
     db.commit()
     
-    return {"message": f"User {email} upgraded to Pro tier"}
+    return {"message": f"User {upgrade.email} upgraded to Pro tier"}
 
 @router.post("/admin/reset-search-count")
-async def reset_search_count(
+def reset_search_count(
     email: str,
     db: Session = Depends(get_db),
     _admin: models.User = Depends(security.require_admin),
@@ -195,64 +213,53 @@ async def reset_search_count(
         "message": f"Search count reset for {email}",
         "previous_count": old_count,
         "new_count": 0,
-        "searches_remaining": security.FREE_TIER_LIMIT if user.tier == "free" else -1
+        "searches_remaining": security.FREE_TIER_LIMIT if user.tier == models.TIER_FREE else -1
     }
 
 @router.get("/admin/stats")
-async def get_platform_stats(
+def get_platform_stats(
     db: Session = Depends(get_db),
     _admin: models.User = Depends(security.require_admin),
 ):
-    from sqlalchemy import func, and_
-    from datetime import datetime, timedelta
+    from sqlalchemy import func, and_, case
+    from datetime import timedelta
     
-    # Basic counts
-    total_users = db.query(models.User).count()
-    pro_users = db.query(models.User).filter(models.User.tier == "pro").count()
+    User = models.User
+    now = clock.now()
+    thirty_days_ago = now - timedelta(days=30)
+    seven_days_ago = now - timedelta(days=7)
+    is_oauth = User.oauth_provider.isnot(None)
+    is_recent = User.created_at >= seven_days_ago
+
+    def count_where(condition):
+        return func.count(case((condition, 1)))
+
+    # All user statistics in one table scan
+    user_stats = db.query(
+        func.count(User.id),
+        count_where(User.tier == models.TIER_PRO),
+        # Users at free tier limit
+        count_where(and_(User.tier == models.TIER_FREE, User.search_count >= security.FREE_TIER_LIMIT)),
+        # OAuth statistics
+        count_where(is_oauth),
+        count_where(User.oauth_provider.is_(None)),
+        # Users by OAuth provider
+        count_where(User.oauth_provider == "google"),
+        count_where(User.oauth_provider == "github"),
+        # Active users (logged in within last 30 days)
+        count_where(User.last_login >= thirty_days_ago),
+        # Recent sign-ups (last 7 days), in total and by method
+        count_where(is_recent),
+        count_where(and_(is_recent, is_oauth)),
+        count_where(and_(is_recent, User.oauth_provider.is_(None))),
+    ).one()
+    (
+        total_users, pro_users, users_at_limit,
+        oauth_users, email_users, google_users, github_users,
+        active_users, recent_signups, recent_oauth, recent_email,
+    ) = user_stats
     free_users = total_users - pro_users
-    total_searches = db.query(models.SearchHistory).count()
-    
-    # Users at free tier limit
-    users_at_limit = db.query(models.User).filter(
-        and_(
-            models.User.tier == "free",
-            models.User.search_count >= security.FREE_TIER_LIMIT
-        )
-    ).count()
-    
-    # OAuth statistics
-    oauth_users = db.query(models.User).filter(models.User.oauth_provider.isnot(None)).count()
-    email_users = db.query(models.User).filter(models.User.oauth_provider.is_(None)).count()
-    
-    # Users by OAuth provider
-    google_users = db.query(models.User).filter(models.User.oauth_provider == "google").count()
-    github_users = db.query(models.User).filter(models.User.oauth_provider == "github").count()
-    
-    # Active users (logged in within last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    active_users = db.query(models.User).filter(
-        models.User.last_login >= thirty_days_ago
-    ).count()
-    
-    # Recent sign-ups (last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    recent_signups = db.query(models.User).filter(
-        models.User.created_at >= seven_days_ago
-    ).count()
-    
-    # Recent sign-ups by method
-    recent_oauth = db.query(models.User).filter(
-        and_(
-            models.User.created_at >= seven_days_ago,
-            models.User.oauth_provider.isnot(None)
-        )
-    ).count()
-    recent_email = db.query(models.User).filter(
-        and_(
-            models.User.created_at >= seven_days_ago,
-            models.User.oauth_provider.is_(None)
-        )
-    ).count()
+    total_searches = db.query(func.count(models.SearchHistory.id)).scalar()
     
     return {
         "total_users": total_users,
@@ -303,7 +310,7 @@ if OAUTH_AVAILABLE:
     async def google_login_route(request: Request):
         """Initiate Google OAuth login"""
         try:
-            return await oauth.google_login(request)
+            return await _get_oauth().google_login(request)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -314,7 +321,7 @@ if OAUTH_AVAILABLE:
     async def google_callback_route(request: Request, db: Session = Depends(get_db)):
         """Handle Google OAuth callback"""
         try:
-            result = await oauth.google_callback(request, db)
+            result = await _get_oauth().google_callback(request, db)
             
             # Redirect to frontend with token in URL (frontend will extract it)
             # In production, you might want to use a more secure method like httpOnly cookies
@@ -1,5 +1,5 @@
 """Pydantic schemas for request/response validation"""
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from datetime import datetime
 from typing import Optional
 
@@ -15,6 +15,8 @@ class UserLogin(BaseModel):
     password: str
 
 class UserResponse(UserBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     tier: str
     search_count: int
@@ -24,9 +26,6 @@ class UserResponse(UserBase):
     last_login: Optional[datetime]
     profile_picture: Optional[str] = None
 
-    class Config:
-        from_attributes = True
-
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -35,6 +34,9 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+class UpgradeUserRequest(BaseModel):
+    email: EmailStr
+
 class SearchTrack(BaseModel):
     query: str
     collection: Optional[str] = None
@@ -1,15 +1,23 @@
 """Security utilities: Password hashing and JWT tokens"""
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import case, func, or_, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from . import clock
 from .database import get_db
-from .models import User
-from .schemas import TokenData
+from .models import FREE_TIER_LIMIT, TIER_FREE, TIER_PRO, User
+import hashlib
 import os
+import threading
+import time
 
 # Configuration - JWT_SECRET_KEY MUST be set in the environment.
 # Fail closed: a missing/placeholder secret makes every token forgeable, so we
@@ -23,8 +31,14 @@ if not SECRET_KEY or SECRET_KEY.startswith("CHANGE_THIS"):
     )
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+# Built once: given a string key, jose re-parses it as JSON and constructs
+# a new HMAC key on every encode/decode
+_JWT_KEY = jwk.construct(SECRET_KEY, ALGORITHM)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Load the bcrypt backend (and run passlib's backend self-checks) at import
+# instead of on the first /register or /login request
+pwd_context.handler().get_backend()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # Comma-separated list of admin emails, e.g. ADMIN_EMAILS="a@x.com,b@y.com"
@@ -34,9 +48,20 @@ ADMIN_EMAILS = {
     if e.strip()
 }
 
-FREE_TIER_LIMIT = 15
 PRO_TIER_LIMIT = -1
 
+# Logins closer together than this don't rewrite last_login
+LAST_LOGIN_RESOLUTION = timedelta(seconds=60)
+
+# Verified token subjects, keyed by the token's SHA-256 (never the raw token).
+# A browser reuses one token for days, so its signature only needs checking
+# once per TTL; the user row is still loaded per request so tier and usage
+# are always current. Entries never outlive the token's own exp.
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAX = int(os.getenv("TOKEN_CACHE_MAX", "10000"))
+_token_cache: "OrderedDict[bytes, tuple[str, float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -45,9 +70,40 @@ def get_password_hash(password: str) -> str:
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS))
+    expire = clock.now() + (expires_delta or timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _JWT_KEY, algorithm=ALGORITHM)
+
+def decode_token_subject(token: str) -> Optional[str]:
+    """Return the verified ``sub`` claim of a token, or None if it is invalid."""
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            email, expires_at = cached
+            if expires_at > now:
+                _token_cache.move_to_end(key)
+                return email
+            del _token_cache[key]
+
+    try:
+        payload = jwt.decode(token, _JWT_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+
+    expires_at = now + TOKEN_CACHE_TTL
+    if payload.get("exp") is not None:
+        expires_at = min(expires_at, float(payload["exp"]))
+    with _token_cache_lock:
+        _token_cache[key] = (email, expires_at)
+        _token_cache.move_to_end(key)
+        if len(_token_cache) > TOKEN_CACHE_MAX:
+            _token_cache.popitem(last=False)
+    return email
 
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
@@ -55,13 +111,129 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
 def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
     return db.query(User).filter(User.id == user_id).first()
 
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE ... RETURNING
+_UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+def upsert_google_user(
+    db: Session,
+    email: str,
+    google_id: str,
+    full_name: Optional[str] = None,
+    profile_picture: Optional[str] = None,
+) -> User:
+    """Create or link a Google-authenticated user and stamp last_login.
+
+    On PostgreSQL and SQLite this is one INSERT ... ON CONFLICT (email) DO
+    UPDATE ... RETURNING, which also closes the race between two concurrent
+    first logins. Existing profile values win over Google's. Other dialects,
+    and a Google account whose email changed (a google_id conflict), fall
+    back to select-then-write.
+    """
+    now = clock.now()
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(User).values(
+            email=email,
+            full_name=full_name,
+            google_id=google_id,
+            oauth_provider="google",
+            profile_picture=profile_picture,
+            hashed_password=None,  # OAuth users don't have passwords
+            last_login=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.email],
+            set_={
+                "google_id": func.coalesce(User.google_id, stmt.excluded.google_id),
+                "oauth_provider": case((User.google_id.is_(None), "google"), else_=User.oauth_provider),
+                "profile_picture": func.coalesce(User.profile_picture, stmt.excluded.profile_picture),
+                "full_name": func.coalesce(User.full_name, stmt.excluded.full_name),
+                "last_login": stmt.excluded.last_login,
+            },
+        ).returning(User)
+        try:
+            user = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+        except IntegrityError:
+            db.rollback()
+        else:
+            # Keep the RETURNING values; commit would expire them and reload
+            db.expunge(user)
+            db.commit()
+            return user
+
+    # Check if user exists by email or google_id: one indexed lookup per
+    # column instead of an OR the planner may turn into a scan
+    user = db.scalars(
+        select(User).from_statement(
+            union_all(
+                select(User).where(User.email == email),
+                select(User).where(User.google_id == google_id),
+            ).limit(1)
+        )
+    ).first()
+    if user:
+        # Update existing user with OAuth info if needed
+        if not user.google_id:
+            user.google_id = google_id
+            user.oauth_provider = 'google'
+        if profile_picture and not user.profile_picture:
+            user.profile_picture = profile_picture
+        if full_name and not user.full_name:
+            user.full_name = full_name
+        user.last_login = now
+    else:
+        # Create new user from OAuth
+        user = User(
+            email=email,
+            full_name=full_name,
+            google_id=google_id,
+            oauth_provider='google',
+            profile_picture=profile_picture,
+            hashed_password=None,
+            last_login=now,
+        )
+        db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+def last_login_is_current(last_login: Optional[datetime], logged_in_at: datetime) -> bool:
+    """Whether touch_last_login would skip recording ``logged_in_at``."""
+    if last_login is None:
+        return False
+    if last_login.tzinfo is not None:  # PostgreSQL returns aware UTC values
+        last_login = last_login.astimezone(timezone.utc).replace(tzinfo=None)
+    return last_login >= logged_in_at - LAST_LOGIN_RESOLUTION
+
+def touch_last_login(bind, user_id: int, logged_in_at: datetime) -> None:
+    """Record a login with a single UPDATE in its own short-lived session.
+
+    Runs as a background task after the login response is sent; the WHERE
+    clause skips the write when the previous login is within
+    LAST_LOGIN_RESOLUTION.
+    """
+    with Session(bind) as db:
+        db.execute(
+            update(User)
+            .where(
+                User.id == user_id,
+                or_(
+                    User.last_login.is_(None),
+                    User.last_login < logged_in_at - LAST_LOGIN_RESOLUTION,
+                ),
+            )
+            .values(last_login=logged_in_at)
+        )
+        db.commit()
+
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     user = get_user_by_email(db, email)
     if not user or not verify_password(password, user.hashed_password):
         return None
     return user
 
-async def get_current_user(
+# Sync so FastAPI runs the user lookup in its threadpool, off the event loop
+def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
@@ -71,16 +243,11 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+    email = decode_token_subject(token)
+    if email is None:
         raise credentials_exception
     
-    user = get_user_by_email(db, email=token_data.email)
+    user = get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
     
@@ -106,7 +273,7 @@ async def require_admin(
     return current_user
 
 def check_search_limit(user: User) -> tuple[bool, int, str]:
-    if user.tier == "pro":
+    if user.tier == TIER_PRO:
         return True, -1, "Unlimited searches (Pro tier)"
 
     searches_remaining = max(FREE_TIER_LIMIT - user.search_count, 0)
@@ -123,14 +290,14 @@ def reserve_search(db: Session, user: User) -> tuple[bool, int]:
     The conditional UPDATE prevents concurrent requests from both passing the
     free-tier limit. Pro users are not incremented.
     """
-    if user.tier == "pro":
+    if user.tier == TIER_PRO:
         return True, -1
 
     updated = (
         db.query(User)
         .filter(
             User.id == user.id,
-            User.tier == "free",
+            User.tier == TIER_FREE,
             User.search_count < FREE_TIER_LIMIT,
         )
         .update(
@@ -151,7 +318,7 @@ def reserve_search(db: Session, user: User) -> tuple[bool, int]:
 
 def refund_search(db: Session, user: User) -> None:
     """Return a reserved free-tier search when the search pipeline fails."""
-    if user.tier == "pro":
+    if user.tier == TIER_PRO:
         return
 
     (
@@ -0,0 +1,31 @@
+"""Session cookie for the Google OAuth round trip only"""
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+OAUTH_PATH = "/api/auth/google"
+OAUTH_STATE_MAX_AGE = 600  # Seconds a user has to finish the Google consent screen
+
+class OAuthSessionMiddleware:
+    """SessionMiddleware limited to the OAuth routes.
+
+    Authlib keeps the OAuth state and nonce in ``request.session`` between
+    /google/login and /google/callback. The signed cookie is scoped to those
+    paths, so browsers never send it elsewhere and every other request skips
+    session decoding entirely.
+    """
+
+    def __init__(self, app: ASGIApp, secret_key: str, max_age: int = OAUTH_STATE_MAX_AGE):
+        self.app = app
+        self.session_app = SessionMiddleware(
+            app,
+            secret_key=secret_key,
+            session_cookie="oauth_session",
+            max_age=max_age,
+            path=OAUTH_PATH,
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(OAUTH_PATH + "/"):
+            await self.session_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -8,9 +8,23 @@ import time
 from pathlib import Path
 from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+# Optional fast JSON (pip install orjson); falls back to json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Sibling module: works both as a script and as data_collection.<module>
+try:
+    from .rate_control import COURTLISTENER_MAX_RPS, RateController
+except ImportError:
+    from rate_control import COURTLISTENER_MAX_RPS, RateController
+
 # Load environment variables
 load_dotenv()
 
@@ -38,8 +52,24 @@ class CourtListenerCollector:
             print("⚠️  No API token found - using rate-limited access")
             print("💡 Get a free token at: https://www.courtlistener.com/api/rest-info/")
         
+        # One keep-alive session: pages 2..N reuse the TCP+TLS connection.
+        # urllib3 retries throttled/unavailable responses with backoff and
+        # honours Retry-After on 429/503.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(
+            pool_maxsize=20,
+            max_retries=Retry(total=5, backoff_factor=1.5, status_forcelist=[429, 502, 503]),
+        ))
+        
         self.batch_size = 20  # Fetch 20 at a time
-        self.delay = 2 if self.api_token else 5  # Slower rate without token
+        self.delay = 2 if self.api_token else 5  # Starting seconds between requests
+        # Starts at one request per delay and adapts from there; without a
+        # token it never goes above that starting rate
+        self.rate = RateController(
+            rps=1 / self.delay,
+            max_rps=COURTLISTENER_MAX_RPS if self.api_token else 1 / self.delay,
+        )
     
     def fetch_opinions(self, limit: int = 100000, court: str = "scotus") -> List[Dict]:
         """
@@ -59,7 +89,10 @@ class CourtListenerCollector:
             while len(all_opinions) < limit and next_url:
                 try:
                     # Make request
-                    response = requests.get(next_url, headers=self.headers, timeout=30)
+                    self.rate.wait()
+                    started = time.monotonic()
+                    response = self.session.get(next_url, timeout=30)
+                    self.rate.update(response, time.monotonic() - started)
                     
                     if response.status_code == 401:
                         print("\n❌ Authentication failed!")
@@ -72,7 +105,7 @@ class CourtListenerCollector:
                         return all_opinions
                     
                     response.raise_for_status()
-                    data = response.json()
+                    data = orjson.loads(response.content) if orjson is not None else response.json()
                     
                     # Extract opinions
                     results = data.get('results', [])
@@ -84,21 +117,15 @@ class CourtListenerCollector:
                     # Get next page
                     next_url = data.get('next')
                     
-                    # Rate limiting
-                    time.sleep(self.delay)
-                    
                     # Stop if we have enough
                     if len(all_opinions) >= limit:
                         break
                     
                 except requests.exceptions.RequestException as e:
+                    # Includes rate limiting that outlasted the session's retries
                     print(f"\n⚠️  Request failed: {e}")
-                    
-                    if "429" in str(e):
-                        print("⏸️  Rate limit hit - waiting 60 seconds...")
-                        time.sleep(60)
-                    else:
-                        break
+                    self.rate.on_error()
+                    break
         
         # Trim to exact limit
         all_opinions = all_opinions[:limit]
@@ -112,8 +139,12 @@ class CourtListenerCollector:
         
         print(f"💾 Saving to {output_file}...")
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(opinions, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            # Same layout as the json fallback, encoded to UTF-8 in one call
+            output_file.write_bytes(orjson.dumps(opinions, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(opinions, f, indent=2, ensure_ascii=False)
         
         print(f"✅ Saved {len(opinions)} opinions")
         return output_file
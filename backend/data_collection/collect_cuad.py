@@ -2,13 +2,179 @@
 CUAD Dataset Collection - Working Version
 Downloads from official sources: HuggingFace, Zenodo, or creates sample dataset
 """
+import copy
 import json
+import mmap
 import os
+import time
+import zlib
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+import ijson
 import requests
-from typing import Dict, List
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, List
 from tqdm import tqdm
 
+# Optional fast JSON writer (pip install orjson); falls back to json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Read the download 1 MiB at a time: fewer Python-level read/parse calls
+READ_SIZE = 1 << 20
+
+# (connect, read) seconds: a dead mirror fails in seconds, not minutes
+DOWNLOAD_TIMEOUT = (5, 60)
+
+# A rate-limited (429) mirror is retried after its Retry-After this many times
+RATE_LIMIT_RETRIES = 2
+MAX_RETRY_AFTER = 60
+
+def _retry_after_seconds(response: requests.Response) -> float:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    value = response.headers.get("Retry-After", "")
+    try:
+        wait = float(value)
+    except ValueError:
+        try:
+            wait = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            wait = 5
+    return min(max(wait, 0), MAX_RETRY_AFTER)
+
+# (title, context, question, answer, contract_type) for the offline sample dataset
+_SAMPLE_TEMPLATES = (
+    (
+        "Software License Agreement",
+        "This Software License Agreement ('Agreement') is entered into as of January 1, 2024, "
+        "by and between TechCorp Inc. ('Licensor') and UserCompany LLC ('Licensee'). "
+        "The Licensor grants to Licensee a non-exclusive, non-transferable license to use the Software "
+        "for a term of five (5) years. The license fee shall be $50,000 per year, payable annually in advance.",
+        "What is the license term?",
+        "five (5) years",
+        "software_license"
+    ),
+    (
+        "Service Agreement",
+        "This Service Agreement is made effective as of February 15, 2024, between ServicePro Inc. "
+        "('Provider') and ClientCorp ('Client'). Provider agrees to provide consulting services "
+        "for a period of three (3) years at a rate of $150 per hour. Payment terms are Net 30 days.",
+        "What is the hourly rate?",
+        "$150 per hour",
+        "service_agreement"
+    ),
+    (
+        "Non-Disclosure Agreement",
+        "This Non-Disclosure Agreement ('NDA') is executed on March 1, 2024, by and between "
+        "InnovateTech LLC ('Disclosing Party') and PartnerCo Inc. ('Receiving Party'). "
+        "The Receiving Party agrees to maintain confidentiality for a period of two (2) years "
+        "following the termination of this agreement.",
+        "What is the confidentiality period?",
+        "two (2) years",
+        "nda"
+    ),
+    (
+        "Partnership Agreement",
+        "This Partnership Agreement is entered into on April 10, 2024, between Alpha Ventures "
+        "and Beta Holdings. The partnership shall continue for an initial term of ten (10) years, "
+        "with automatic renewal unless terminated. Profits and losses shall be shared equally.",
+        "What is the initial partnership term?",
+        "ten (10) years",
+        "partnership"
+    ),
+    (
+        "Employment Contract",
+        "This Employment Agreement is effective as of May 1, 2024, between MegaCorp Inc. ('Employer') "
+        "and John Doe ('Employee'). The Employee is hired as Senior Developer at an annual salary "
+        "of $120,000. The employment term is indefinite, subject to termination provisions. "
+        "The Employee is entitled to 20 days of paid vacation per year.",
+        "What is the annual salary?",
+        "$120,000",
+        "employment"
+    ),
+    (
+        "Lease Agreement",
+        "This Commercial Lease Agreement is dated June 1, 2024, between Property Owner LLC ('Landlord') "
+        "and Retail Store Inc. ('Tenant'). The lease term shall be seven (7) years commencing on July 1, 2024. "
+        "Monthly rent is $8,000, payable on the first day of each month.",
+        "What is the monthly rent?",
+        "$8,000",
+        "lease"
+    ),
+    (
+        "Purchase Agreement",
+        "This Asset Purchase Agreement is entered into on July 15, 2024, between Seller Co. and Buyer Inc. "
+        "The purchase price for all assets is $2,500,000, payable in three installments over 18 months. "
+        "Closing shall occur within sixty (60) days of the execution of this agreement.",
+        "What is the total purchase price?",
+        "$2,500,000",
+        "purchase"
+    ),
+    (
+        "Distribution Agreement",
+        "This Distribution Agreement is effective August 1, 2024, between Manufacturer LLC ('Supplier') "
+        "and Distributor Corp. ('Distributor'). The exclusive distribution rights are granted for "
+        "a territory covering the Western United States for an initial term of five (5) years.",
+        "What territory is covered?",
+        "Western United States",
+        "distribution"
+    ),
+    (
+        "Franchise Agreement",
+        "This Franchise Agreement is dated September 1, 2024, between FranchiseCo Inc. ('Franchisor') "
+        "and Franchisee LLC ('Franchisee'). The initial franchise fee is $75,000, with an ongoing "
+        "royalty of 6% of gross sales. The franchise term is twelve (12) years.",
+        "What is the initial franchise fee?",
+        "$75,000",
+        "franchise"
+    ),
+    (
+        "Consulting Agreement",
+        "This Consulting Agreement is executed on October 1, 2024, between Expert Advisors Inc. "
+        "('Consultant') and StartupCo ('Client'). The Consultant shall provide strategic advisory "
+        "services for a fixed monthly fee of $10,000 for a period of one (1) year.",
+        "What is the monthly consulting fee?",
+        "$10,000",
+        "consulting"
+    ),
+)
+
+# Built once at import: answer offsets are found a single time per template
+_SAMPLE_CONTRACTS = tuple(
+    {
+        "id": f"sample_{i}",
+        "title": title,
+        "context": context,
+        "question": question,
+        "answers": {"text": [answer], "answer_start": [context.find(answer)]},
+        "metadata": {
+            "source": "sample",
+            "contract_type": contract_type,
+            "parties": ["Party A", "Party B"]
+        }
+    }
+    for i, (title, context, question, answer, contract_type) in enumerate(_SAMPLE_TEMPLATES)
+)
+
+def _json_options(pretty: bool) -> dict:
+    """json.dump(s) keywords: 2-space indent when pretty, else no whitespace"""
+    if pretty:
+        return {"indent": 2, "ensure_ascii": False}
+    return {"separators": (",", ":"), "ensure_ascii": False}
+
+def _encode_contracts(contracts: List[Dict], pretty: bool = False) -> bytes:
+    """contracts.json bytes: UTF-8, non-ASCII kept as-is, compact unless pretty"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(contracts, option=option)
+    return json.dumps(contracts, **_json_options(pretty)).encode('utf-8')
+
+# The sample dataset never changes, so its file contents are encoded once.
+# It is meant to be read by hand, so it is always indented.
+_SAMPLE_JSON = _encode_contracts(list(_SAMPLE_CONTRACTS), pretty=True)
+
 class CUADCollector:
     """Collect CUAD (Contract Understanding Atticus Dataset) contracts"""
     
@@ -16,6 +182,15 @@ class CUADCollector:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # One keep-alive session for every source, so redirects and retries
+        # to the same host reuse the TCP+TLS connection. No transport-level
+        # retries: connection errors, timeouts and 5xx fail over to the next
+        # source immediately (see download_to_file).
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
         # Multiple download sources (in order of preference)
         self.sources = [
             {
@@ -30,65 +205,108 @@ class CUADCollector:
             }
         ]
     
+    @property
+    def raw_file(self) -> Path:
+        """Where the downloaded CUAD_v1.json is kept between runs"""
+        return self.output_dir / "CUAD_v1.json"
+    
     def download_from_source(self, source: Dict) -> List[Dict]:
         """Try downloading from a specific source"""
-        print(f"📥 Trying {source['name']}...")
-        print(f"   URL: {source['url']}")
+        if self.raw_file.exists():
+            print(f"♻️  Reusing {self.raw_file}")
+        else:
+            print(f"📥 Trying {source['name']}...")
+            print(f"   URL: {source['url']}")
         
         try:
-            response = requests.get(source['url'], timeout=300, stream=True)
-            response.raise_for_status()
-            
-            # Get total size for progress bar
-            total_size = int(response.headers.get('content-length', 0))
-            
-            # Download with progress bar
-            content = b""
-            with tqdm(total=total_size, unit='B', unit_scale=True, desc="Downloading") as pbar:
-                for chunk in response.iter_content(chunk_size=8192):
-                    content += chunk
-                    pbar.update(len(chunk))
-            
-            # Parse JSON
-            data = json.loads(content.decode('utf-8'))
-            
-            # Handle different JSON structures
-            if isinstance(data, dict):
-                if 'data' in data:
-                    contracts = data['data']
-                elif 'paragraphs' in data:
-                    contracts = self.parse_squad_format(data)
-                else:
-                    # Assume it's a single contract
-                    contracts = [data]
-            else:
-                contracts = data
-            
+            if not self.raw_file.exists():
+                self.download_to_file(source['url'])
+            contracts = self.load_contracts_file(self.raw_file)
             print(f"✅ Downloaded {len(contracts)} contracts from {source['name']}")
             return contracts
             
         except requests.exceptions.RequestException as e:
             print(f"❌ Failed: {e}")
             return []
+        except (ijson.JSONError, ValueError) as e:
+            # Unparseable download: drop it so the next source fetches afresh
+            print(f"❌ Failed: {e}")
+            self.raw_file.unlink(missing_ok=True)
+            return []
     
-    def parse_squad_format(self, data: Dict) -> List[Dict]:
-        """Parse SQuAD-formatted CUAD data"""
-        contracts = []
+    def download_to_file(self, url: str) -> None:
+        """Stream the response body to raw_file without holding it in memory.
+        
+        Chunks go to a per-URL .part file that is renamed once complete, so
+        an existing raw_file is always a finished download. A .part left by
+        an interrupted run is resumed with a Range request.
+        
+        Failures raise requests exceptions for download_cuad to fail over
+        on: connection errors, timeouts and 5xx right away; 429 only after
+        RATE_LIMIT_RETRIES waits of Retry-After on this source.
+        """
+        part_file = self.raw_file.with_name(f"{self.raw_file.name}.{zlib.crc32(url.encode()):08x}.part")
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            offset = part_file.stat().st_size if part_file.exists() else 0
+            # identity: byte offsets must be file offsets for Range to work
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            response = self.session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True)
+            if response.status_code == 416:  # Stale .part; start over
+                response.close()
+                part_file.unlink()
+                continue
+            if response.status_code == 429 and attempt < RATE_LIMIT_RETRIES:
+                wait = _retry_after_seconds(response)
+                response.close()
+                print(f"   ⏳ Rate limited, retrying in {wait:.0f}s...")
+                time.sleep(wait)
+                continue
+            response.raise_for_status()
+            break
+        else:  # Every attempt hit a stale .part
+            response.raise_for_status()
         
-        if 'data' in data:
-            for document in data['data']:
-                for paragraph in document.get('paragraphs', []):
-                    context = paragraph.get('context', '')
-                    for qa in paragraph.get('qas', []):
-                        contracts.append({
-                            'id': qa.get('id', ''),
-                            'context': context,
-                            'question': qa.get('question', ''),
-                            'answers': qa.get('answers', []),
-                            'is_impossible': qa.get('is_impossible', False)
-                        })
+        resumed = response.status_code == 206
+        if resumed:
+            print(f"   ↪️  Resuming at {offset / (1024 * 1024):.1f} MB")
+        else:
+            offset = 0
         
-        return contracts
+        # Get total size for progress bar
+        total_size = int(response.headers.get('content-length', 0)) + offset
+        
+        with open(part_file, 'ab' if resumed else 'wb') as f, \
+                tqdm(total=total_size, initial=offset, unit='B', unit_scale=True, desc="Downloading") as pbar:
+            for chunk in response.iter_content(chunk_size=READ_SIZE):
+                f.write(chunk)
+                pbar.update(len(chunk))
+        os.replace(part_file, self.raw_file)
+    
+    def load_contracts_file(self, path: Path) -> List[Dict]:
+        """Parse contracts from a CUAD_v1.json on disk.
+        
+        CUAD_v1.json is SQuAD-shaped ({"data": [contract, ...]}). ijson walks
+        a read-only mmap of the file, so the page cache holds the raw bytes
+        and only the parsed contracts live on the Python heap.
+        """
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return list(ijson.items(mm, 'data.item', use_float=True, buf_size=READ_SIZE))
+    
+    def parse_squad_format(self, documents) -> Iterator[Dict]:
+        """Flatten SQuAD-formatted CUAD documents into one record per question"""
+        for document in documents:
+            for paragraph in document.get('paragraphs', []):
+                context = paragraph.get('context', '')
+                for qa in paragraph.get('qas', []):
+                    yield {
+                        'id': qa.get('id', ''),
+                        'context': context,
+                        'question': qa.get('question', ''),
+                        'answers': qa.get('answers', []),
+                        'is_impossible': qa.get('is_impossible', False)
+                    }
     
     def download_cuad(self) -> List[Dict]:
         """Try downloading CUAD from multiple sources"""
@@ -138,128 +356,33 @@ class CUADCollector:
         print("📝 Creating sample contract dataset...")
         print("💡 This is for testing only. For production, download real CUAD data.")
         
-        sample_contracts = [
-            {
-                "id": f"sample_{i}",
-                "title": title,
-                "context": context,
-                "question": question,
-                "answers": {"text": [answer], "answer_start": [context.find(answer)]},
-                "metadata": {
-                    "source": "sample",
-                    "contract_type": contract_type,
-                    "parties": ["Party A", "Party B"]
-                }
-            }
-            for i, (title, context, question, answer, contract_type) in enumerate([
-                (
-                    "Software License Agreement",
-                    "This Software License Agreement ('Agreement') is entered into as of January 1, 2024, "
-                    "by and between TechCorp Inc. ('Licensor') and UserCompany LLC ('Licensee'). "
-                    "The Licensor grants to Licensee a non-exclusive, non-transferable license to use the Software "
-                    "for a term of five (5) years. The license fee shall be $50,000 per year, payable annually in advance.",
-                    "What is the license term?",
-                    "five (5) years",
-                    "software_license"
-                ),
-                (
-                    "Service Agreement",
-                    "This Service Agreement is made effective as of February 15, 2024, between ServicePro Inc. "
-                    "('Provider') and ClientCorp ('Client'). Provider agrees to provide consulting services "
-                    "for a period of three (3) years at a rate of $150 per hour. Payment terms are Net 30 days.",
-                    "What is the hourly rate?",
-                    "$150 per hour",
-                    "service_agreement"
-                ),
-                (
-                    "Non-Disclosure Agreement",
-                    "This Non-Disclosure Agreement ('NDA') is executed on March 1, 2024, by and between "
-                    "InnovateTech LLC ('Disclosing Party') and PartnerCo Inc. ('Receiving Party'). "
-                    "The Receiving Party agrees to maintain confidentiality for a period of two (2) years "
-                    "following the termination of this agreement.",
-                    "What is the confidentiality period?",
-                    "two (2) years",
-                    "nda"
-                ),
-                (
-                    "Partnership Agreement",
-                    "This Partnership Agreement is entered into on April 10, 2024, between Alpha Ventures "
-                    "and Beta Holdings. The partnership shall continue for an initial term of ten (10) years, "
-                    "with automatic renewal unless terminated. Profits and losses shall be shared equally.",
-                    "What is the initial partnership term?",
-                    "ten (10) years",
-                    "partnership"
-                ),
-                (
-                    "Employment Contract",
-                    "This Employment Agreement is effective as of May 1, 2024, between MegaCorp Inc. ('Employer') "
-                    "and John Doe ('Employee'). The Employee is hired as Senior Developer at an annual salary "
-                    "of $120,000. The employment term is indefinite, subject to termination provisions. "
-                    "The Employee is entitled to 20 days of paid vacation per year.",
-                    "What is the annual salary?",
-                    "$120,000",
-                    "employment"
-                ),
-                (
-                    "Lease Agreement",
-                    "This Commercial Lease Agreement is dated June 1, 2024, between Property Owner LLC ('Landlord') "
-                    "and Retail Store Inc. ('Tenant'). The lease term shall be seven (7) years commencing on July 1, 2024. "
-                    "Monthly rent is $8,000, payable on the first day of each month.",
-                    "What is the monthly rent?",
-                    "$8,000",
-                    "lease"
-                ),
-                (
-                    "Purchase Agreement",
-                    "This Asset Purchase Agreement is entered into on July 15, 2024, between Seller Co. and Buyer Inc. "
-                    "The purchase price for all assets is $2,500,000, payable in three installments over 18 months. "
-                    "Closing shall occur within sixty (60) days of the execution of this agreement.",
-                    "What is the total purchase price?",
-                    "$2,500,000",
-                    "purchase"
-                ),
-                (
-                    "Distribution Agreement",
-                    "This Distribution Agreement is effective August 1, 2024, between Manufacturer LLC ('Supplier') "
-                    "and Distributor Corp. ('Distributor'). The exclusive distribution rights are granted for "
-                    "a territory covering the Western United States for an initial term of five (5) years.",
-                    "What territory is covered?",
-                    "Western United States",
-                    "distribution"
-                ),
-                (
-                    "Franchise Agreement",
-                    "This Franchise Agreement is dated September 1, 2024, between FranchiseCo Inc. ('Franchisor') "
-                    "and Franchisee LLC ('Franchisee'). The initial franchise fee is $75,000, with an ongoing "
-                    "royalty of 6% of gross sales. The franchise term is twelve (12) years.",
-                    "What is the initial franchise fee?",
-                    "$75,000",
-                    "franchise"
-                ),
-                (
-                    "Consulting Agreement",
-                    "This Consulting Agreement is executed on October 1, 2024, between Expert Advisors Inc. "
-                    "('Consultant') and StartupCo ('Client'). The Consultant shall provide strategic advisory "
-                    "services for a fixed monthly fee of $10,000 for a period of one (1) year.",
-                    "What is the monthly consulting fee?",
-                    "$10,000",
-                    "consulting"
-                )
-            ])
-        ]
+        # Deep copies: callers may mutate the nested answers/metadata
+        sample_contracts = copy.deepcopy(list(_SAMPLE_CONTRACTS))
         
         print(f"✅ Created {len(sample_contracts)} sample contracts")
         print("   Includes: Software License, Services, NDA, Partnership, Employment, etc.")
         return sample_contracts
     
-    def save_contracts(self, contracts: List[Dict], filename: str = "contracts.json"):
-        """Save contracts to JSON file"""
+    def save_contracts(self, contracts: List[Dict], filename: str = "contracts.json", pretty: bool = False):
+        """Save contracts to JSON file.
+
+        Compact by default: indentation makes the stdlib encoder slower and
+        the file 20-30% larger for the ingestion steps that read it back.
+        Pass ``pretty=True`` for a file meant to be read by hand.
+        """
         output_file = self.output_dir / filename
         
         print(f"\n💾 Saving to {output_file}...")
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(contracts, f, indent=2, ensure_ascii=False)
+        if len(contracts) == len(_SAMPLE_CONTRACTS) and tuple(contracts) == _SAMPLE_CONTRACTS:
+            # Unmodified sample dataset: write the pre-encoded bytes
+            output_file.write_bytes(_SAMPLE_JSON)
+        elif orjson is not None:
+            # Same layout as the json fallback, encoded to UTF-8 in one call
+            output_file.write_bytes(_encode_contracts(contracts, pretty))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(contracts, f, **_json_options(pretty))
         
         file_size = output_file.stat().st_size
         print(f"✅ Saved {len(contracts)} contracts ({file_size / 1024:.1f} KB)")
@@ -7,6 +7,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from data_collection.collect_courtlistener import CourtListenerCollector
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,9 +30,27 @@ headers = {
     'User-Agent': 'LawScout-AI/1.0'
 }
 
-for endpoint in endpoints:
+# One session for all probes: its pooled keep-alive connections to the
+# shared host are reused, and the probes run concurrently so the sweep
+# takes about one round trip instead of four
+session = requests.Session()
+session.headers.update(headers)
+
+def probe(endpoint):
+    try:
+        return session.get(endpoint, timeout=10)
+    except Exception as e:
+        return e
+
+with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+    results = list(executor.map(probe, endpoints))
+
+for endpoint, response in zip(endpoints, results):
+    if isinstance(response, Exception):
+        print(f'  ❌ Exception: {response}')
+        print()
+        continue
     try:
-        response = requests.get(endpoint, headers=headers, timeout=10)
         print(f'{endpoint}')
         print(f'  Status: {response.status_code}')
         if response.status_code == 200:
@@ -44,4 +63,3 @@ for endpoint in endpoints:
     except Exception as e:
         print(f'  ❌ Exception: {e}')
         print()
-
@@ -3,12 +3,17 @@ LawScout AI - FastAPI Backend
 Wraps existing RAG engine without modifying it
 """
 import os
+import asyncio
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from slowapi import _rate_limit_exceeded_handler
@@ -16,37 +21,113 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from limiter import limiter
 from auth import router as auth_router, init_db
+from auth.session import OAuthSessionMiddleware
+from api.compression import SkipEventStreamCompression, ZstdMiddleware
+
+# Optional Brotli compression (pip install brotli-asgi)
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # Setup logging to file
 log_dir = Path("logs")
 log_dir.mkdir(exist_ok=True)
 log_file = log_dir / "backend.log"
 
+# Request threads only format the record and put it on a queue; a
+# listener thread does the blocking file and console writes
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler(log_file, delay=True),
+    logging.StreamHandler(),  # Also log to console
+    respect_handler_level=True,
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()  # Also log to console
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
+log_listener.start()
 
 # Load environment variables
 load_dotenv()
 
-# Import your existing RAG engine (NO CHANGES TO YOUR CODE!)
-from rag_system.rag_engine import LegalRAGEngine
-
 # Global RAG engine instance
 rag_engine = None
+rag_engine_status = "loading"
+
+async def _load_rag_engine(app: FastAPI, warmup: list) -> None:
+    """Load the RAG engine off the event loop, then warm the search cache.
+
+    Runs as a background task so the server starts accepting requests (and
+    /health answers) while the models load. Searches wait on
+    app.state.rag_engine_loaded, which is set whether or not loading worked.
+    """
+    global rag_engine, rag_engine_status
+    logger = logging.getLogger(__name__)
+    
+    # Imported here, not at module scope: it pulls in sentence-transformers/
+    # torch, Qdrant and Gemini, which the process has no use for until now
+    logger.info("🚀 Initializing LawScout AI RAG Engine...")
+    print("🚀 Initializing LawScout AI RAG Engine...")
+    try:
+        from rag_system.rag_engine import LegalRAGEngine
+        from api.batching import SearchBatcher
+        engine = await asyncio.to_thread(LegalRAGEngine)
+        # Coalesce concurrent searches into one query-embedding pass
+        app.state.search_batcher = SearchBatcher(engine)
+        app.state.search_batcher.start()
+        # Store in app state for easy access in routes
+        app.state.rag_engine = rag_engine = engine
+        rag_engine_status = "initialized"
+        logger.info("✅ RAG Engine ready!")
+        print("✅ RAG Engine ready!")
+    except Exception as e:
+        rag_engine_status = "failed"
+        logger.error(f"❌ Failed to initialize RAG engine: {e}", exc_info=True)
+        print(f"❌ Failed to initialize RAG engine: {e}")
+        return
+    finally:
+        app.state.rag_engine_loaded.set()
+    
+    # Every worker runs the warmup: queries already in the reloaded cache are
+    # skipped, the rest cost one real search (Gemini call) each per worker.
+    # SEARCH_WARMUP_LIMIT caps that; 0 disables it.
+    from api.routes import warm_search_cache
+    try:
+        if warmup:
+            logger.info(f"🔥 Warmed {await warm_search_cache(app.state, warmup)} searches")
+    except Exception as e:
+        logger.warning(f"⚠️  Could not warm search cache (non-critical): {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize database and RAG engine on startup"""
-    global rag_engine
     
-    # Initialize database first (critical for auth)
+    # Cached second-resolution clock for the auth hot paths
+    from auth import clock
+    clock_task = asyncio.get_running_loop().create_task(clock.tick())
+    
+    # Size the shared thread pool used by asyncio.to_thread/run_in_executor
+    # for blocking RAG work (search, reranking, Gemini calls)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_THREAD_POOL_SIZE", "32")),
+            thread_name_prefix="rag_worker",
+        )
+    )
+    
     logger = logging.getLogger(__name__)
+    
+    # uvicorn[standard] installs uvloop + httptools and both uvicorn and the
+    # gunicorn UvicornWorker pick them automatically; say so if they're missing
+    loop_module = type(asyncio.get_running_loop()).__module__
+    if not loop_module.startswith("uvloop"):
+        logger.warning(f"⚠️  Running on the {loop_module} event loop; install uvicorn[standard] for uvloop")
+    
+    # Initialize database first (critical for auth)
     logger.info("🗄️  Initializing database...")
     try:
         init_db()
@@ -57,19 +138,38 @@ async def lifespan(app: FastAPI):
         print(f"❌ Failed to initialize database: {e}")
         raise
     
-    # Initialize RAG engine
-    logger.info("🚀 Initializing LawScout AI RAG Engine...")
-    print("🚀 Initializing LawScout AI RAG Engine...")
+    # Warm the search cache (non-critical): reload the previous process's
+    # cache now, and once the engine has loaded run the homepage example
+    # queries so the first users to click them don't pay cold retrieval +
+    # LLM cost.
+    from api.routes import load_search_cache, load_warmup_queries, save_search_cache
+    cache_file = os.getenv("SEARCH_CACHE_FILE")
+    if cache_file:
+        try:
+            logger.info(f"♻️  Reloaded {load_search_cache(Path(cache_file))} cached searches")
+        except Exception as e:
+            logger.warning(f"⚠️  Could not reload search cache (non-critical): {e}")
+    warmup = []
     try:
-        rag_engine = LegalRAGEngine()
-        # Store in app state for easy access in routes
-        app.state.rag_engine = rag_engine
-        logger.info("✅ RAG Engine ready!")
-        print("✅ RAG Engine ready!")
+        warmup = load_warmup_queries(
+            Path(os.getenv("SEARCH_WARMUP_FILE", Path(__file__).parent / "warmup_queries.json")),
+            int(os.getenv("SEARCH_WARMUP_LIMIT", "5")),
+        )
     except Exception as e:
-        logger.error(f"❌ Failed to initialize RAG engine: {e}", exc_info=True)
-        print(f"❌ Failed to initialize RAG engine: {e}")
-        raise
+        logger.warning(f"⚠️  Could not read warmup queries (non-critical): {e}")
+    
+    # Load the RAG engine in the background: the models take long enough to
+    # load that blocking here would fail the platform's startup health check
+    app.state.rag_engine_loaded = asyncio.Event()
+    load_task = asyncio.get_running_loop().create_task(_load_rag_engine(app, warmup))
+    
+    # Prefetch Google OAuth discovery + JWKS (non-critical; OAuth is optional)
+    from auth.routes import OAUTH_AVAILABLE, _get_oauth
+    try:
+        if OAUTH_AVAILABLE:
+            await _get_oauth().preload_google_metadata()
+    except Exception as e:
+        logger.warning(f"⚠️  Could not preload Google OAuth metadata (non-critical): {e}")
     
     # Log initial usage stats (non-blocking - don't fail startup if this fails)
     try:
@@ -84,12 +184,23 @@ async def lifespan(app: FastAPI):
     
     logger.info("👋 Shutting down RAG engine...")
     print("👋 Shutting down RAG engine...")
+    load_task.cancel()
+    if getattr(app.state, "search_batcher", None) is not None:
+        await app.state.search_batcher.stop()
+    clock_task.cancel()
+    if cache_file:
+        try:
+            logger.info(f"💾 Saved {save_search_cache(Path(cache_file))} cached searches")
+        except Exception as e:
+            logger.warning(f"⚠️  Could not save search cache: {e}")
+    log_listener.stop()  # Flushes queued records
 
 # Create FastAPI app
 app = FastAPI(
     title="LawScout AI API",
     version="2.1.1",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Rate limiting (per client IP). Global default in limiter.py; stricter
@@ -98,43 +209,79 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
-# Session middleware for OAuth (must be before other middleware)
-import os
+# Signed session cookie for the Google OAuth round trip, scoped to
+# /api/auth/google/* so no other request carries or decodes a session
 SESSION_SECRET = os.getenv("SESSION_SECRET", os.getenv("JWT_SECRET_KEY", "CHANGE_THIS_IN_PRODUCTION"))
-app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET)
+app.add_middleware(OAuthSessionMiddleware, secret_key=SESSION_SECRET)
 
 # Response compression - reduces network transfer time significantly
-# This works great with Cloudflare CDN which also compresses responses
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# This works great with Cloudflare CDN which also compresses responses.
+# Legal text compresses 4-8x; level 5 keeps most of that at a fraction of the
+# CPU of level 9. Brotli (~20% smaller than gzip for English text) is used
+# when brotli-asgi is installed; it falls back to gzip for older clients.
+# Clients that accept zstd (modern browsers via Cloudflare) get zstd level 3
+# when zstandard is installed: a better ratio than gzip at a fraction of
+# the CPU per response.
+# Streamed searches (text/event-stream) skip compression: the compressors
+# hold a streaming body back until it ends, which would defeat streaming.
+if BrotliMiddleware is not None:
+    fallback, fallback_options = BrotliMiddleware, {
+        "quality": 5, "minimum_size": 1024, "gzip_fallback": True,
+    }
+else:
+    fallback, fallback_options = GZipMiddleware, {"minimum_size": 1024, "compresslevel": 5}
+app.add_middleware(
+    SkipEventStreamCompression, compressor=ZstdMiddleware,
+    minimum_size=1024, fallback=fallback, fallback_options=fallback_options,
+)
 
-# CORS - Allow both old (Streamlit) and new (Next.js) frontends
+# CORS - Allow both old (Streamlit) and new (Next.js) frontends.
+# A frozenset: Starlette checks every request's Origin with `in`, so this is
+# a hash lookup rather than a list scan (or a regex match per request)
+ALLOWED_ORIGINS = frozenset({
+    "https://lawscoutai.com",                    # ✅ Production frontend domain
+    "https://www.lawscoutai.com",                # ✅ Production frontend domain with www
+    "https://api.lawscoutai.com",                # ✅ Backend API domain (for API docs)
+    "https://beta.lawscoutai.com",               # Beta domain (if used)
+    "http://localhost:3000",                     # Local Next.js dev
+    "http://localhost:8501",                     # Local Streamlit dev
+})
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "https://lawscoutai.com",                    # ✅ Production frontend domain
-        "https://www.lawscoutai.com",                # ✅ Production frontend domain with www
-        "https://api.lawscoutai.com",                # ✅ Backend API domain (for API docs)
-        "https://beta.lawscoutai.com",               # Beta domain (if used)
-        "http://localhost:3000",                     # Local Next.js dev
-        "http://localhost:8501",                     # Local Streamlit dev
-    ],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# This worker's psutil handle and its last (monotonic time, RSS MB) reading
+_process = None
+_memory_sample = (float("-inf"), 0.0)
+
+def _memory_mb() -> float:
+    """Worker RSS in MB, re-read at most once a second however often probed"""
+    global _process, _memory_sample
+    now = time.monotonic()
+    if now - _memory_sample[0] >= 1.0:
+        if _process is None:
+            import psutil
+            _process = psutil.Process()
+        _memory_sample = (now, _process.memory_info().rss / 1024 / 1024)
+    return _memory_sample[1]
+
 # Health check endpoint
 @app.get("/health")
 async def health():
-    """Health check for monitoring"""
-    import psutil
-    import os
-    
-    memory_mb = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+    """Health check for monitoring.
+
+    Always 200 once the server is up; ``rag_engine`` reports whether the
+    background load is still "loading", "initialized" or "failed".
+    """
+    memory_mb = _memory_mb()
     
     return {
         "status": "healthy",
-        "rag_engine": "initialized" if rag_engine else "not_initialized",
+        "rag_engine": rag_engine_status,
         "memory_mb": round(memory_mb, 2),
         "memory_warning": memory_mb > 1800  # Warn if > 90% of 2GB
     }
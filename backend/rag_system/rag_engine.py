@@ -4,6 +4,7 @@ Combines vector search with Gemini LLM for legal question answering
 Features: Hybrid search, reranking, advanced filtering, citation extraction
 """
 import os
+from collections import deque
 from typing import List, Dict, Optional, Generator
 from qdrant_client import QdrantClient
 from qdrant_client.models import Filter, FieldCondition, MatchValue, Range
@@ -12,6 +13,7 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime
 import json
+import time
 
 from .hybrid_search import HybridSearchEngine
 from .citation_utils import CitationExtractor
@@ -64,8 +66,8 @@ class LegalRAGEngine:
             'cases': 'legal_cases'
         }
         
-        # Analytics tracking
-        self.analytics = []
+        # Analytics tracking (last 1000 queries; deque appends are thread-safe)
+        self.analytics = deque(maxlen=1000)
         
         # Hybrid search and reranking
         print("📥 Initializing hybrid search engine...")
@@ -82,7 +84,8 @@ class LegalRAGEngine:
         limit: int = 5,
         filters: Optional[Dict] = None,
         use_hybrid: bool = True,
-        use_reranking: bool = True
+        use_reranking: bool = True,
+        query_vector: Optional[List[float]] = None
     ) -> List[Dict]:
         """
         Search vector database for relevant legal documents
@@ -94,6 +97,7 @@ class LegalRAGEngine:
             filters: Optional filters (date_range, jurisdiction, court)
             use_hybrid: Use hybrid search (semantic + BM25)
             use_reranking: Use cross-encoder reranking
+            query_vector: Precomputed query embedding (see encode_queries)
         
         Returns:
             List of relevant chunks with metadata
@@ -102,8 +106,9 @@ class LegalRAGEngine:
         print(f"   Collection: {collection_type}")
         print(f"   Limit: {limit}")
         
-        # Generate query embedding
-        query_vector = self.encoder.encode(query).tolist()
+        # Generate query embedding (unless the caller already batch-encoded it)
+        if query_vector is None:
+            query_vector = self.encoder.encode(query).tolist()
         
         results = []
         
@@ -176,6 +181,15 @@ class LegalRAGEngine:
         print(f"✅ Total results: {len(results)}")
         return results
     
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one encoder forward pass
+        
+        The encoder cost is nearly flat in batch size, so concurrent searches
+        can share a single call and pass the vectors to ask(query_vector=...).
+        """
+        return self.encoder.encode(queries).tolist()
+    
     def _build_qdrant_filter(self, filters: Dict) -> Optional[Filter]:
         """
         Build Qdrant filter from filter dictionary
@@ -323,7 +337,8 @@ Note: LLM answer generation is temporarily unavailable. Check your Gemini API ke
         filters: Optional[Dict] = None,
         use_hybrid: bool = True,
         use_reranking: bool = True,
-        extract_citations: bool = True
+        extract_citations: bool = True,
+        query_vector: Optional[List[float]] = None
     ) -> Dict:
         """
         Complete RAG pipeline: search + generate with advanced features
@@ -338,32 +353,35 @@ Note: LLM answer generation is temporarily unavailable. Check your Gemini API ke
             use_hybrid: Use hybrid search (semantic + BM25)
             use_reranking: Use cross-encoder reranking
             extract_citations: Extract and link citations
+            query_vector: Precomputed query embedding (see encode_queries)
         
         Returns:
             Dict with answer, sources, and metadata
+        
+        Thread safety:
+            The API calls this concurrently from its worker pool (bounded by
+            RAG_MAX_CONCURRENCY). The encoder, reranker, Qdrant and Gemini
+            clients are shared across calls; the only per-call write is the
+            bounded analytics deque.
         """
-        import time as time_module
-        start_time = datetime.now()
-        total_start = time_module.time()
         
         print("\n" + "=" * 60)
         print("💬 Legal Research Query")
         print("=" * 60)
         
         # Step 1: Advanced search with hybrid + reranking
-        search_start = datetime.now()
-        search_start_time = time_module.time()
+        search_start = time.perf_counter()
         results = self.search(
             query=query,
             collection_type=collection_type,
             limit=limit,
             filters=filters,
             use_hybrid=use_hybrid,
-            use_reranking=use_reranking
+            use_reranking=use_reranking,
+            query_vector=query_vector
         )
-        search_time = (datetime.now() - search_start).total_seconds()
-        search_elapsed = time_module.time() - search_start_time
-        print(f"⏱️  Search completed in {search_elapsed:.2f}s")
+        search_time = time.perf_counter() - search_start
+        print(f"⏱️  Search completed in {search_time:.2f}s")
         
         if not results:
             self._track_analytics(query, collection_type, 0, 0, search_time, 0)
@@ -373,15 +391,13 @@ Note: LLM answer generation is temporarily unavailable. Check your Gemini API ke
             }
         
         # Step 2: Generate answer
-        gen_start = datetime.now()
-        gen_start_time = time_module.time()
+        gen_start = time.perf_counter()
         answer = self.generate_answer(query, results, stream=stream)
         
         # If streaming, don't calculate gen_time yet
-        gen_time = 0 if stream else (datetime.now() - gen_start).total_seconds()
+        gen_time = 0 if stream else time.perf_counter() - gen_start
         if not stream:
-            gen_elapsed = time_module.time() - gen_start_time
-            print(f"⏱️  Answer generation completed in {gen_elapsed:.2f}s")
+            print(f"⏱️  Answer generation completed in {gen_time:.2f}s")
         
         # Step 3: Prepare response
         response = {
@@ -426,7 +442,6 @@ Note: LLM answer generation is temporarily unavailable. Check your Gemini API ke
         
         # Track analytics (only if not streaming)
         if not stream:
-            total_time = (datetime.now() - start_time).total_seconds()
             self._track_analytics(
                 query, 
                 collection_type, 
@@ -451,20 +466,16 @@ Note: LLM answer generation is temporarily unavailable. Check your Gemini API ke
             'generation_time': gen_time,
             'total_time': search_time + gen_time
         })
-        
-        # Keep only last 1000 queries in memory
-        if len(self.analytics) > 1000:
-            self.analytics = self.analytics[-1000:]
     
     def get_analytics(self) -> List[Dict]:
         """Get analytics data"""
-        return self.analytics
+        return list(self.analytics)
     
     def save_analytics(self, filepath: str = 'analytics.json'):
         """Save analytics to file"""
         try:
             with open(filepath, 'w') as f:
-                json.dump(self.analytics, f, indent=2)
+                json.dump(list(self.analytics), f, indent=2)
             print(f"✅ Analytics saved to {filepath}")
         except Exception as e:
             print(f"⚠️  Error saving analytics: {e}")
@@ -99,12 +99,12 @@ class GeminiUsageTracker:
             self.user_usage[user_id]['output_tokens'] += output_tokens
             self.user_usage[user_id]['requests'] += 1
         
-        # Log usage
-        daily_cost = self.get_daily_cost()
-        logger.debug(
-            f"📊 Usage tracked: {input_tokens} input, {output_tokens} output tokens. "
-            f"Daily cost: ${daily_cost:.4f}"
-        )
+        # Log usage (skip the cost computation unless DEBUG is enabled)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "📊 Usage tracked: %s input, %s output tokens. Daily cost: $%.4f",
+                input_tokens, output_tokens, self.get_daily_cost()
+            )
     
     def get_daily_cost(self) -> float:
         """Calculate daily cost in USD"""
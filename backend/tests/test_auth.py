@@ -0,0 +1,269 @@
+"""Regression tests for bearer token verification."""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("JWT_SECRET_KEY", "test-only-secret-that-is-long-enough-for-jwt-signing")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from auth import clock, models, schemas, security
+from auth.database import Base, get_db
+from auth.routes import router
+from auth.session import OAuthSessionMiddleware
+from limiter import limiter
+
+
+def make_db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+
+def setup_function():
+    security._token_cache.clear()
+
+
+def test_token_signature_is_verified_once_per_cache_entry(monkeypatch):
+    token = security.create_access_token(data={"sub": "researcher@example.com"})
+    decodes = []
+    real_decode = security.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decodes.append(1)
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", counting_decode)
+
+    assert security.decode_token_subject(token) == "researcher@example.com"
+    assert security.decode_token_subject(token) == "researcher@example.com"
+    assert len(decodes) == 1
+    assert token.encode() not in security._token_cache
+
+
+def test_invalid_and_expired_tokens_are_rejected():
+    expired = security.create_access_token(
+        data={"sub": "researcher@example.com"}, expires_delta=timedelta(seconds=-1)
+    )
+    assert security.decode_token_subject(expired) is None
+    assert security.decode_token_subject("not-a-jwt") is None
+    assert not security._token_cache
+
+
+def test_admin_stats_aggregates_users_in_one_query():
+    engine, db = make_db()
+    db.add_all([
+        models.User(email="pro@example.com", tier="pro", last_login=datetime.utcnow()),
+        models.User(email="free@example.com", tier="free", search_count=security.FREE_TIER_LIMIT),
+        models.User(email="google@example.com", oauth_provider="google", google_id="g-1"),
+    ])
+    db.flush()
+    db.add(models.SearchHistory(user_id=1, query="q", collection="both", result_count=1))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[security.require_admin] = lambda: None
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        stats = TestClient(app).get("/api/auth/admin/stats").json()
+    finally:
+        db.close()
+
+    assert len(statements) == 2
+    assert stats["total_users"] == 3
+    assert stats["pro_users"] == 1
+    assert stats["free_users"] == 2
+    assert stats["users_at_limit"] == 1
+    assert stats["oauth_users"] == stats["google_users"] == 1
+    assert stats["email_users"] == 2
+    assert stats["github_users"] == 0
+    assert stats["active_users_30d"] == 1
+    assert stats["recent_signups_7d"] == 3
+    assert stats["recent_oauth_signups_7d"] == 1
+    assert stats["recent_email_signups_7d"] == 2
+    assert stats["total_searches"] == 1
+
+
+def test_google_upsert_creates_then_links_without_overwriting_profile():
+    engine, db = make_db()
+    try:
+        db.add(models.User(email="lawyer@example.com", hashed_password="hash", full_name="Existing Name"))
+        db.commit()
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        linked = security.upsert_google_user(
+            db, email="lawyer@example.com", google_id="g-1", full_name="Google Name", profile_picture="pic"
+        )
+        created = security.upsert_google_user(db, email="new@example.com", google_id="g-2")
+
+        assert len(statements) == 2
+        assert (linked.google_id, linked.oauth_provider) == ("g-1", "google")
+        assert (linked.full_name, linked.profile_picture) == ("Existing Name", "pic")
+        assert linked.hashed_password == "hash"
+        assert linked.last_login is not None
+        assert (created.tier, created.search_count, created.is_active) == ("free", 0, True)
+        assert created.created_at is not None
+        assert db.query(models.User).count() == 2
+    finally:
+        db.close()
+
+
+def test_google_upsert_keeps_account_when_google_email_changes():
+    _engine, db = make_db()
+    try:
+        original = security.upsert_google_user(db, email="old@example.com", google_id="g-1")
+        renamed = security.upsert_google_user(db, email="new@example.com", google_id="g-1")
+
+        assert renamed.id == original.id
+        assert renamed.email == "old@example.com"
+        assert db.query(models.User).count() == 1
+    finally:
+        db.close()
+
+
+def test_login_records_last_login_once_per_resolution_window():
+    _engine, db = make_db()
+    user = models.User(email="lawyer@example.com", hashed_password=security.get_password_hash("correct horse"))
+    db.add(user)
+    db.commit()
+
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+    try:
+        credentials = {"username": "lawyer@example.com", "password": "correct horse"}
+        first = client.post("/api/auth/login", data=credentials)
+        assert first.status_code == 200
+        body = first.json()
+        assert body["token_type"] == "bearer"
+        assert body["user"]["searches_remaining"] == security.FREE_TIER_LIMIT
+        assert body["user"]["last_login"] is not None
+        assert set(body["user"]) == set(schemas.UserResponse.model_fields)
+        db.expire_all()
+        recorded = db.get(models.User, user.id).last_login
+        assert recorded is not None
+
+        second = client.post("/api/auth/login", data=credentials)
+        assert second.status_code == 200
+        db.expire_all()
+        assert db.get(models.User, user.id).last_login == recorded
+        assert second.json()["user"]["last_login"] == body["user"]["last_login"]
+    finally:
+        db.close()
+
+
+def test_searches_remaining_matches_in_python_and_sql():
+    _engine, db = make_db()
+    try:
+        db.add_all([
+            models.User(email="free@example.com", tier="free", search_count=4),
+            models.User(email="pro@example.com", tier="pro", search_count=40),
+        ])
+        db.commit()
+
+        for user in db.query(models.User):
+            remaining = db.query(models.User.searches_remaining).filter(models.User.id == user.id).scalar()
+            assert remaining == user.searches_remaining
+        free = security.get_user_by_email(db, "free@example.com")
+        assert free.searches_remaining == security.FREE_TIER_LIMIT - 4
+        assert schemas.UserResponse.model_validate(free).searches_remaining == free.searches_remaining
+    finally:
+        db.close()
+
+
+def test_admin_upgrade_is_a_single_update():
+    engine, db = make_db()
+    db.add(models.User(email="lawyer@example.com"))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[security.require_admin] = lambda: None
+    client = TestClient(app)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        upgraded = client.post("/api/auth/admin/upgrade-user", json={"email": "lawyer@example.com"})
+        assert upgraded.status_code == 200
+        assert len(statements) == 1
+        assert client.post("/api/auth/admin/upgrade-user", json={"email": "nobody@example.com"}).status_code == 404
+        assert client.post("/api/auth/admin/upgrade-user", json={"email": "not-an-email"}).status_code == 422
+        db.expire_all()
+        assert security.get_user_by_email(db, "lawyer@example.com").tier == "pro"
+    finally:
+        db.close()
+
+
+def test_clock_serves_the_ticked_time_and_falls_back_when_stopped():
+    async def run():
+        task = asyncio.get_running_loop().create_task(clock.tick(interval=60))
+        await asyncio.sleep(0)
+        first = clock.now()
+        await asyncio.sleep(0.01)
+        assert clock.now() is first  # Cached until the next tick
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert clock._now is None
+    assert abs(clock.now() - datetime.utcnow()) < timedelta(seconds=1)
+
+
+def test_register_validates_raw_body_with_standard_errors():
+    _engine, db = make_db()
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+    try:
+        created = client.post("/api/auth/register", json={"email": "new@example.com", "password": "long enough"})
+        assert created.status_code == 201
+        assert created.json()["user"]["email"] == "new@example.com"
+
+        rejected = client.post("/api/auth/register", json={"email": "new2@example.com", "password": "short"})
+        assert rejected.status_code == 422
+        assert rejected.json()["detail"][0]["loc"] == ["body", "password"]
+        assert "requestBody" in app.openapi()["paths"]["/api/auth/register"]["post"]
+    finally:
+        db.close()
+
+
+def test_oauth_session_cookie_is_scoped_to_google_routes():
+    app = FastAPI()
+    app.add_middleware(OAuthSessionMiddleware, secret_key="test-session-secret")
+
+    @app.get("/api/auth/google/login")
+    def google_login(request: Request):
+        request.session["oauth_state"] = "state"
+        return {}
+
+    @app.get("/api/auth/google/callback")
+    def google_callback(request: Request):
+        return {"state": request.session.pop("oauth_state", None)}
+
+    @app.get("/api/auth/me")
+    def me(request: Request):
+        return {"has_session": "session" in request.scope}
+
+    client = TestClient(app)
+    login = client.get("/api/auth/google/login")
+    assert "path=/api/auth/google" in login.headers["set-cookie"]
+    assert client.get("/api/auth/me").json() == {"has_session": False}
+    assert client.get("/api/auth/google/callback").json() == {"state": "state"}
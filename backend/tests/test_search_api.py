@@ -1,6 +1,10 @@
 """Regression tests for authenticated search accounting and source metadata."""
+import asyncio
+import json
 import os
 
+import pytest
+
 os.environ.setdefault("JWT_SECRET_KEY", "test-only-secret-that-is-long-enough-for-jwt-signing")
 os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
 
@@ -9,14 +13,35 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+from starlette.middleware.gzip import GZipMiddleware
 
-from api.routes import _query_cache, _transform_sources_optimized, router
+from api.batching import SearchBatcher
+from api.compression import SkipEventStreamCompression, ZstdMiddleware, zstandard
+from api.models import SearchRequest
+from api.routes import (
+    _HOT_PROMOTE_HITS,
+    _cache_get,
+    _cache_max_size,
+    _cache_put,
+    _create_cache_key,
+    _hit_counts,
+    _hot_cache,
+    _inflight,
+    _query_cache,
+    _semantic_index,
+    _single_flight,
+    _transform_sources_optimized,
+    load_search_cache,
+    router,
+    save_search_cache,
+    warm_search_cache,
+)
 from auth import models, security
 from auth.database import Base, get_db
 
 
 class FakeRAGEngine:
-    def ask(self, *_args):
+    def ask(self, *_args, **_kwargs):
         return {
             "answer": "Grounded answer [Source 1]",
             "num_sources": 1,
@@ -83,6 +108,9 @@ def make_app(search_count=0, authenticated=True):
 
 def setup_function():
     _query_cache.clear()
+    _hot_cache.clear()
+    _hit_counts.clear()
+    _semantic_index.clear()
 
 
 def test_search_requires_authentication():
@@ -113,6 +141,7 @@ def test_search_atomically_counts_usage_and_preserves_metadata():
 
         db.refresh(user)
         assert user.search_count == 15
+        assert user.last_login is None  # Searches don't count as logins
         assert db.query(models.SearchHistory).count() == 1
 
         blocked = client.post(
@@ -126,11 +155,180 @@ def test_search_atomically_counts_usage_and_preserves_metadata():
         db.close()
 
 
+def test_cached_search_reports_current_searches_remaining():
+    app, db, user = make_app(search_count=10)
+    client = TestClient(app)
+    try:
+        body = {"query": "Florida contract law", "collection": "cases"}
+        first = client.post("/api/v1/search", json=body)
+        second = client.post("/api/v1/search", json=body)
+
+        assert first.headers["x-cache-status"] == "MISS"
+        assert second.headers["x-cache-status"] == "HIT"
+        assert second.headers["cache-control"] == "private, no-store"
+        assert second.headers["etag"] == first.headers["etag"]
+        assert first.headers["etag"].startswith('W/"')
+        assert first.json()["metadata"]["searches_remaining"] == 4
+        assert second.json()["metadata"]["searches_remaining"] == 3
+        assert second.json()["sources"] == first.json()["sources"]
+        assert db.query(models.SearchHistory).count() == 2
+    finally:
+        db.close()
+
+
+def test_paraphrased_query_hits_semantic_cache():
+    app, db, _user = make_app()
+
+    class EmbeddingRAGEngine(FakeRAGEngine):
+        calls = 0
+
+        def encode_queries(self, queries):
+            # "res judicata" paraphrases share a direction; others do not
+            return [[1.0, 0.01] if "judicata" in q else [0.0, 1.0] for q in queries]
+
+        def ask(self, *_args, **kwargs):
+            EmbeddingRAGEngine.calls += 1
+            assert kwargs["query_vector"] is not None
+            return super().ask()
+
+    app.state.rag_engine = EmbeddingRAGEngine()
+    client = TestClient(app)
+    try:
+        first = client.post("/api/v1/search", json={"query": "What is res judicata?", "collection": "cases"})
+        paraphrase = client.post("/api/v1/search", json={"query": "what is res-judicata", "collection": "cases"})
+        other_collection = client.post(
+            "/api/v1/search", json={"query": "what is res-judicata", "collection": "contracts"}
+        )
+        unrelated = client.post("/api/v1/search", json={"query": "Florida lease law", "collection": "cases"})
+
+        assert first.headers["x-cache-status"] == "MISS"
+        assert paraphrase.headers["x-cache-status"] == "HIT"
+        assert paraphrase.json()["sources"] == first.json()["sources"]
+        assert other_collection.headers["x-cache-status"] == "MISS"
+        assert unrelated.headers["x-cache-status"] == "MISS"
+        assert EmbeddingRAGEngine.calls == 3
+    finally:
+        db.close()
+
+
+def test_search_finished_during_embedding_is_served_from_cache():
+    app, db, _user = make_app()
+    body = {"query": "What is res judicata?", "collection": "cases"}
+    key = _create_cache_key(SearchRequest(**body))
+    client = TestClient(app)
+    try:
+        client.post("/api/v1/search", json=body)
+        finished = _cache_get(key)
+        setup_function()
+
+        class RacingRAGEngine(FakeRAGEngine):
+            calls = 0
+
+            def encode_queries(self, queries):
+                # An identical search completes while this one is embedding
+                _cache_put(key, finished)
+                return [[1.0, 0.0] for _ in queries]
+
+            def ask(self, *_args, **_kwargs):
+                RacingRAGEngine.calls += 1
+                return super().ask()
+
+        app.state.rag_engine = RacingRAGEngine()
+        response = client.post("/api/v1/search", json=body)
+
+        assert response.headers["x-cache-status"] == "HIT"
+        assert RacingRAGEngine.calls == 0
+    finally:
+        db.close()
+
+
+def test_streamed_search_sends_sources_before_answer_tokens():
+    app, db, user = make_app(search_count=0)
+
+    class StreamingRAGEngine(FakeRAGEngine):
+        def ask(self, *_args, **kwargs):
+            results = super().ask()
+            if kwargs.get("stream"):
+                results["answer"] = iter(["Grounded ", "answer"])
+            return results
+
+    app.state.rag_engine = StreamingRAGEngine()
+    try:
+        response = TestClient(app).post(
+            "/api/v1/search",
+            json={"query": "Florida contract law", "collection": "cases", "stream": True},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+        head = json.loads(events[0])
+        assert head["sources"][0]["metadata"]["court"] == "Florida Supreme Court"
+        assert head["metadata"]["searches_remaining"] == 14
+        assert [json.loads(e)["token"] for e in events[1:-1]] == ["Grounded ", "answer"]
+        assert events[-1] == "[DONE]"
+        assert db.query(models.SearchHistory).count() == 1
+    finally:
+        db.close()
+
+
+def _run_compressed(
+    content_type: bytes, chunks: list, accept_encoding: bytes = b"gzip", **options
+) -> list:
+    """Send ``chunks`` through the compression stack; return what was sent after each chunk."""
+    sent, seen = [], []
+
+    async def app(_scope, _receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+            seen.append(list(sent))
+
+    async def send(message):
+        sent.append(message)
+
+    options = options or {"compressor": GZipMiddleware}
+    middleware = SkipEventStreamCompression(app, minimum_size=100, **options)
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding)]}
+    asyncio.run(middleware(scope, None, send))
+    return seen
+
+
+def test_event_stream_is_not_held_back_by_gzip():
+    seen = _run_compressed(b"text/event-stream", [b"data: first\n\n" * 20, b"data: [DONE]\n\n"])
+    # The first event reached the client before the stream completed
+    start, first = seen[0]
+    assert first["body"] == b"data: first\n\n" * 20
+    assert b"content-encoding" not in dict(start["headers"])
+
+
+def test_json_responses_are_still_gzipped():
+    seen = _run_compressed(b"application/json", [b"[" + b"1," * 500 + b"1]"])
+    assert dict(seen[-1][0]["headers"])[b"content-encoding"] == b"gzip"
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard not installed")
+def test_zstd_is_used_when_accepted_and_gzip_otherwise():
+    body = b"[" + b"1," * 500 + b"1]"
+    options = {"compressor": ZstdMiddleware, "fallback": GZipMiddleware,
+               "fallback_options": {"minimum_size": 100}}
+
+    start, message = _run_compressed(b"application/json", [body], b"gzip, zstd", **options)[-1]
+    assert dict(start["headers"])[b"content-encoding"] == b"zstd"
+    assert zstandard.ZstdDecompressor().decompress(message["body"]) == body
+
+    start, _ = _run_compressed(b"application/json", [body], b"gzip", **options)[-1]
+    assert dict(start["headers"])[b"content-encoding"] == b"gzip"
+
+    # SSE still bypasses both encoders
+    start, _ = _run_compressed(b"text/event-stream", [b"data: x\n\n" * 200], b"zstd", **options)[0]
+    assert b"content-encoding" not in dict(start["headers"])
+
+
 def test_failed_search_refunds_reserved_usage():
     app, db, user = make_app(search_count=3)
 
     class BrokenRAGEngine:
-        def ask(self, *_args):
+        def ask(self, *_args, **_kwargs):
             raise RuntimeError("external service unavailable")
 
     app.state.rag_engine = BrokenRAGEngine()
@@ -147,6 +345,30 @@ def test_failed_search_refunds_reserved_usage():
         db.close()
 
 
+def test_search_returns_503_while_rag_engine_is_still_loading(monkeypatch):
+    monkeypatch.setattr("api.routes.RAG_READY_TIMEOUT", 0.01)
+    app, db, user = make_app(search_count=3)
+    app.state.rag_engine_loaded = asyncio.Event()
+    try:
+        response = TestClient(app).post(
+            "/api/v1/search",
+            json={"query": "Federal contract law", "collection": "cases"},
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "10"
+        db.refresh(user)
+        assert user.search_count == 3
+
+        app.state.rag_engine_loaded.set()
+        response = TestClient(app).post(
+            "/api/v1/search",
+            json={"query": "Federal contract law", "collection": "cases"},
+        )
+        assert response.status_code == 200
+    finally:
+        db.close()
+
+
 def test_state_query_transformation_does_not_reference_court_before_assignment():
     transformed = _transform_sources_optimized(
         [
@@ -163,6 +385,32 @@ def test_state_query_transformation_does_not_reference_court_before_assignment()
     assert 0 <= transformed[0]["score"] <= 1
 
 
+def test_filename_title_drops_exhibit_prefix_date_and_extension():
+    transformed = _transform_sources_optimized(
+        [{"score": 0.5, "full_text": "", "metadata": {"title": "Unknown", "filename": "EX-10.1_acme-saas_2020-01-02.pdf"}}]
+    )
+    assert transformed[0]["metadata"]["title"] == "Acme Saas"
+
+
+def test_query_punctuation_does_not_filter_on_topic_sources():
+    sources = [
+        {"score": 0.05, "full_text": f"Indemnification and warranty terms limit liability ({i})."}
+        for i in range(3)
+    ]
+    transformed = _transform_sources_optimized(sources, "What about indemnification? warranty? liability?")
+    assert len(transformed) == 3
+
+
+def test_search_openapi_still_documents_search_response():
+    app, db, _user = make_app()
+    try:
+        schema = TestClient(app).get("/openapi.json").json()
+        ok = schema["paths"]["/api/v1/search"]["post"]["responses"]["200"]
+        assert ok["content"]["application/json"]["schema"]["$ref"].endswith("/SearchResponse")
+    finally:
+        db.close()
+
+
 def test_search_request_validation_rejects_unknown_collection():
     app, db, _user = make_app()
     try:
@@ -173,3 +421,119 @@ def test_search_request_validation_rejects_unknown_collection():
         assert response.status_code == 422
     finally:
         db.close()
+
+
+def test_search_batcher_encodes_concurrent_queries_in_one_pass():
+    class BatchingRAGEngine:
+        def __init__(self):
+            self.encoded = []
+
+        def encode_queries(self, queries):
+            self.encoded.append(list(queries))
+            return [[float(i)] for i in range(len(queries))]
+
+        def ask(self, query, query_vector=None, **_kwargs):
+            return {"answer": query, "vector": query_vector}
+
+    async def run():
+        engine = BatchingRAGEngine()
+        batcher = SearchBatcher(engine, max_batch=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return engine, await asyncio.gather(
+                *(batcher.submit(query=f"query {i}") for i in range(3))
+            )
+        finally:
+            await batcher.stop()
+
+    engine, results = asyncio.run(run())
+    assert engine.encoded == [["query 0", "query 1", "query 2"]]
+    assert [r["answer"] for r in results] == ["query 0", "query 1", "query 2"]
+    assert [r["vector"] for r in results] == [[0.0], [1.0], [2.0]]
+
+
+def test_single_flight_coalesces_identical_concurrent_searches():
+    calls = []
+
+    async def run_search():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "encoded result"
+
+    async def run():
+        return await asyncio.gather(
+            _single_flight(("same query",), run_search),
+            _single_flight(("same query",), run_search),
+        )
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("encoded result", False), ("encoded result", True)]
+    assert not _inflight
+
+
+def test_single_flight_joiner_fails_normally_when_leader_is_cancelled():
+    started = asyncio.Event()
+
+    async def run_search():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        leader = asyncio.create_task(_single_flight(("same query",), run_search))
+        await started.wait()
+        joiner = asyncio.create_task(_single_flight(("same query",), run_search))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.gather(leader, joiner, return_exceptions=True)
+
+    leader_result, joiner_result = asyncio.run(run())
+    assert isinstance(leader_result, asyncio.CancelledError)
+    assert isinstance(joiner_result, RuntimeError)
+    assert not _inflight
+
+
+def test_search_cache_evicts_least_recently_used_entry():
+    for i in range(_cache_max_size):
+        _cache_put((f"query {i}",), f"result {i}")
+    assert _cache_get(("query 0",)) == "result 0"
+
+    _cache_put(("one more",), "newest")
+
+    assert len(_query_cache) == _cache_max_size
+    assert ("query 0",) in _query_cache
+    assert ("query 1",) not in _query_cache
+
+
+def test_popular_query_survives_lru_churn():
+    _cache_put(("popular",), "hot result")
+    for _ in range(_HOT_PROMOTE_HITS):
+        _cache_get(("popular",))
+
+    for i in range(_cache_max_size + 1):
+        _cache_put((f"query {i}",), f"result {i}")
+
+    assert _cache_get(("popular",)) == "hot result"
+
+
+def test_cache_key_ignores_case_spacing_and_trailing_punctuation():
+    assert _create_cache_key(SearchRequest(query="  What is  res judicata? ")) == _create_cache_key(
+        SearchRequest(query="what is res judicata")
+    )
+
+
+def test_cache_warmup_and_persistence_round_trip(tmp_path):
+    app, db, _user = make_app()
+    try:
+        request = SearchRequest(query="What are Miranda rights?", collection="both", limit=5)
+        assert asyncio.run(warm_search_cache(app.state, [request, request])) == 1
+
+        cache_file = tmp_path / "search_cache.json"
+        assert save_search_cache(cache_file) == 1
+        assert [path.name for path in tmp_path.iterdir()] == ["search_cache.json"]
+        cached = dict(_query_cache)
+        _query_cache.clear()
+        assert load_search_cache(cache_file) == 1
+        assert dict(_query_cache) == cached
+    finally:
+        db.close()
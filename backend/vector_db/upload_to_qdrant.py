@@ -4,6 +4,7 @@ Upload Embeddings to Qdrant Vector Database
 import json
 import os
 from pathlib import Path
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 from tqdm import tqdm
@@ -62,6 +63,16 @@ def upload_embeddings(embeddings_file: str, collection_name: str):
     
     print(f"✅ Loaded {len(chunks)} chunks")
     
+    # FP16 vectors saved next to the chunks (generate_embeddings_colab.py);
+    # row i belongs to chunk i. Older files keep them in chunk['embedding'].
+    vectors_file = Path(embeddings_file).with_suffix('.npy')
+    vectors = np.load(vectors_file, mmap_mode='r') if vectors_file.exists() else None
+    if vectors is not None and vectors.shape[0] != len(chunks):
+        raise ValueError(
+            f"{vectors_file} has {vectors.shape[0]:,} vectors for {len(chunks):,} chunks; "
+            "regenerate the embeddings so both files come from the same run"
+        )
+    
     # Create collection
     create_collection(collection_name)
     
@@ -82,7 +93,7 @@ def upload_embeddings(embeddings_file: str, collection_name: str):
             # Create point
             point = PointStruct(
                 id=point_id,
-                vector=chunk['embedding'],
+                vector=chunk['embedding'] if vectors is None else vectors[point_id].astype(np.float32).tolist(),
                 payload=payload
             )
             points.append(point)
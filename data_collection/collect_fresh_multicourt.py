@@ -6,46 +6,92 @@ Fixed version with proper API calls per court
 import os
 import json
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+# Optional fast JSON (pip install orjson); falls back to json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Sibling module: works both as a script and as data_collection.<module>
+try:
+    from .rate_control import COURTLISTENER_MAX_RPS, RateController
+except ImportError:
+    from rate_control import COURTLISTENER_MAX_RPS, RateController
+
 load_dotenv()
 
 API_TOKEN = os.getenv('COURTLISTENER_API_TOKEN')
 BASE_URL = "https://www.courtlistener.com/api/rest/v4/opinions/"
 
+def _json_line(record) -> bytes:
+    """One compact UTF-8 JSONL line"""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode('utf-8')
+
 class CourtCollector:
     def __init__(self):
         self.headers = {
             'Authorization': f'Token {API_TOKEN}',
             'User-Agent': 'LawScout-AI/3.0'
         }
+        # One keep-alive session for every court and page. urllib3 retries
+        # 429/502/503 with backoff (honouring Retry-After) before we see them.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(
+            pool_maxsize=20,
+            max_retries=Retry(total=5, backoff_factor=1.5, status_forcelist=[429, 502, 503]),
+        ))
         self.output_dir = Path('data/courtlistener')
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Adapts to the API's latency and throttling, capped at the quota.
+        # Shared by every court, so parallel courts split one global rate.
+        self.rate = RateController(rps=1.0, max_rps=COURTLISTENER_MAX_RPS)
+        self._combined_lock = threading.Lock()
     
-    def collect_court(self, court_code, target, description):
-        """Collect opinions from a specific court"""
+    def collect_court(self, court_code, target, description, combined, position=0):
+        """Collect opinions from a specific court.
+        
+        Each opinion is written as one JSON line to opinions_<court>.jsonl and
+        to the ``combined`` file as soon as its page arrives, so memory stays
+        at one page of results. Safe to run for several courts at once.
+        Returns the number of opinions written.
+        """
         print(f"\n{'='*70}")
         print(f"📋 {description} ({court_code})")
         print(f"   Target: {target:,} opinions")
         print(f"{'='*70}\n")
         
-        opinions = []
+        collected = 0
         url = f"{BASE_URL}?court={court_code}&order_by=-date_created"
+        output_file = self.output_dir / f"opinions_{court_code}.jsonl"
         
-        with tqdm(total=target, desc=court_code.upper(), unit="opinions") as pbar:
-            while len(opinions) < target and url:
+        with open(output_file, 'wb') as out, \
+                tqdm(total=target, desc=court_code.upper(), unit="opinions", position=position) as pbar:
+            while collected < target and url:
                 try:
-                    response = requests.get(url, headers=self.headers, timeout=30)
+                    self.rate.wait()
+                    started = time.monotonic()
+                    response = self.session.get(url, timeout=30)
+                    self.rate.update(response, time.monotonic() - started)
                     
                     if response.status_code == 200:
-                        data = response.json()
+                        data = orjson.loads(response.content) if orjson is not None else response.json()
                         results = data.get('results', [])
+                        lines = []
                         
                         for result in results:
-                            if len(opinions) >= target:
+                            if collected >= target:
                                 break
                             
                             opinion = {
@@ -60,17 +106,16 @@ class CourtCollector:
                             }
                             
                             if opinion['text']:
-                                opinions.append(opinion)
+                                lines.append(_json_line(opinion))
+                                collected += 1
                                 pbar.update(1)
                         
+                        page = b"".join(lines)
+                        out.write(page)
+                        with self._combined_lock:
+                            combined.write(page)
+                        
                         url = data.get('next')
-                        time.sleep(0.5)
-                    
-                    elif response.status_code in [429, 502, 503]:
-                        wait = 60 if response.status_code == 429 else 30
-                        print(f"\n⚠️  Error {response.status_code}, waiting {wait}s...")
-                        time.sleep(wait)
-                        continue
                     
                     else:
                         print(f"\n❌ Error {response.status_code}")
@@ -78,19 +123,15 @@ class CourtCollector:
                 
                 except Exception as e:
                     print(f"\n❌ Error: {e}")
+                    self.rate.on_error()
                     time.sleep(10)
                     continue
         
-        # Save to individual file
-        output_file = self.output_dir / f"opinions_{court_code}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(opinions, f, indent=2, ensure_ascii=False)
-        
         size_mb = output_file.stat().st_size / (1024 * 1024)
-        print(f"\n✅ Collected {len(opinions):,} from {court_code.upper()}")
+        print(f"\n✅ Collected {collected:,} from {court_code.upper()}")
         print(f"💾 Saved to {output_file.name} ({size_mb:.2f} MB)\n")
         
-        return opinions
+        return collected
 
 def main():
     print("="*70)
@@ -112,33 +153,34 @@ def main():
         ('ca6', 3000, '6th Circuit'),
     ]
     
-    all_opinions = []
-    
-    for court_code, target, description in courts:
-        opinions = collector.collect_court(court_code, target, description)
-        all_opinions.extend(opinions)
-        print(f"📊 Total collected so far: {len(all_opinions):,}\n")
+    # Combined JSONL file, written as each court streams in
+    combined_file = collector.output_dir / "opinions_all_combined.jsonl"
+    courts_count = {}
     
-    # Save combined file
-    combined_file = collector.output_dir / "opinions_all_combined.json"
-    with open(combined_file, 'w', encoding='utf-8') as f:
-        json.dump(all_opinions, f, indent=2, ensure_ascii=False)
+    # Courts are independent: collect them all at once. Pages within a
+    # court still follow one another (cursor pagination), and every court
+    # shares the collector's rate, so total time approaches the API quota
+    # instead of the sum of each court's round trips.
+    with open(combined_file, 'wb') as combined, ThreadPoolExecutor(max_workers=len(courts)) as executor:
+        futures = {
+            court_code: executor.submit(
+                collector.collect_court, court_code, target, description, combined, position
+            )
+            for position, (court_code, target, description) in enumerate(courts)
+        }
+        for court_code, future in futures.items():
+            courts_count[court_code] = future.result()
     
     size_mb = combined_file.stat().st_size / (1024 * 1024)
     
     print("="*70)
     print("✅ COLLECTION COMPLETE!")
     print("="*70)
-    print(f"\n📊 Total opinions: {len(all_opinions):,}")
+    print(f"\n📊 Total opinions: {sum(courts_count.values()):,}")
     print(f"💾 Combined file: {size_mb:.2f} MB")
     print(f"📁 Location: {combined_file}")
     
     # Breakdown by court
-    courts_count = {}
-    for op in all_opinions:
-        court = op.get('court', 'unknown')
-        courts_count[court] = courts_count.get(court, 0) + 1
-    
     print(f"\n📊 Breakdown by court:")
     for court, count in sorted(courts_count.items()):
         print(f"   {court}: {count:,} opinions")
@@ -0,0 +1,76 @@
+"""
+Adaptive request pacing for the CourtListener collectors
+Additive-increase / multiplicative-decrease (AIMD), like TCP congestion control
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+
+# Authenticated CourtListener API quota: 5,000 requests per hour
+COURTLISTENER_MAX_RPS = 5000 / 3600
+
+# Responses that mean the server wants us to slow down
+THROTTLE_STATUSES = frozenset({429, 502, 503})
+
+class RateController:
+    """Request rate that tracks what the server can take.
+
+    Every ``window`` requests whose average latency stays under
+    ``target_latency`` raise the rate by ``increase`` requests/second. A
+    throttled response (also one urllib3 retried away), or a quota header
+    showing under 10% left, multiplies it by ``decrease``. Thread-safe:
+    callers sharing a controller share one rate.
+    """
+    
+    def __init__(self, rps: float = 1.0, min_rps: float = 0.1, max_rps: float = COURTLISTENER_MAX_RPS,
+                 increase: float = 0.5, decrease: float = 0.5, target_latency: float = 1.0,
+                 window: int = 20):
+        self.rps = min(rps, max_rps)
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self._latencies = deque(maxlen=window)
+        self._next_slot = float("-inf")
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """Sleep until the next request slot at the current rate"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rps
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def update(self, response: requests.Response, latency: float):
+        """Adjust the rate after a request that took ``latency`` seconds"""
+        retries = getattr(response.raw, "retries", None)
+        throttled = response.status_code in THROTTLE_STATUSES or any(
+            attempt.status in THROTTLE_STATUSES for attempt in getattr(retries, "history", ())
+        )
+        if throttled or _quota_low(response.headers):
+            self.on_error()
+            return
+        with self._lock:
+            self._latencies.append(latency)
+            if len(self._latencies) == self._latencies.maxlen:
+                if sum(self._latencies) / len(self._latencies) < self.target_latency:
+                    self.rps = min(self.max_rps, self.rps + self.increase)
+                self._latencies.clear()
+    
+    def on_error(self):
+        """Back off after throttling or a failed request"""
+        with self._lock:
+            self.rps = max(self.min_rps, self.rps * self.decrease)
+            self._latencies.clear()
+
+def _quota_low(headers) -> bool:
+    """True when X-RateLimit-Remaining is under 10% of X-RateLimit-Limit"""
+    try:
+        return int(headers["X-RateLimit-Remaining"]) < 0.1 * int(headers["X-RateLimit-Limit"])
+    except (KeyError, ValueError):
+        return False
@@ -2,12 +2,15 @@
 Embedding Generation for Google Colab
 Generates embeddings using sentence-transformers on FREE GPU
 """
-import json
+import hashlib
+from itertools import islice
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 import torch
 from tqdm import tqdm
 import numpy as np
+import ijson
+import orjson
 
 print("🔧 Setup")
 print(f"PyTorch version: {torch.__version__}")
@@ -17,8 +20,12 @@ if torch.cuda.is_available():
 
 # Configuration
 MODEL_NAME = "all-MiniLM-L6-v2"  # Fast, good quality, 384 dimensions
-BATCH_SIZE = 32
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# MiniLM-L6 only saturates a T4/A100 at a few hundred texts per batch
+BATCH_SIZE = 256 if DEVICE == "cuda" else 32
+# Chunks read, encoded and written per step; memory stays at one block.
+# encode() sorts each block by length, so larger blocks also pad less.
+BLOCK_SIZE = BATCH_SIZE * 64
 
 print(f"\n⚙️  Configuration:")
 print(f"   Model: {MODEL_NAME}")
@@ -28,53 +35,80 @@ print(f"   Batch size: {BATCH_SIZE}")
 # Load model
 print(f"\n📥 Loading model...")
 model = SentenceTransformer(MODEL_NAME, device=DEVICE)
+if DEVICE == "cuda":
+    model.half()  # FP16 forward pass: about 2x faster on T4/A100 tensor cores
 print(f"✅ Model loaded on {DEVICE}")
 
-def generate_embeddings(chunks_file: str, output_file: str):
-    """Generate embeddings for chunks"""
-    
-    # Load chunks
-    print(f"\n📂 Loading chunks from {chunks_file}...")
-    with open(chunks_file, 'r') as f:
-        chunks = json.load(f)
-    
-    print(f"✅ Loaded {len(chunks)} chunks")
-    
-    # Extract texts
-    texts = [chunk['text'] for chunk in chunks]
-    
-    # Generate embeddings in batches
-    print(f"\n🔄 Generating embeddings...")
-    embeddings = model.encode(
-        texts,
-        batch_size=BATCH_SIZE,
-        show_progress_bar=True,
-        convert_to_numpy=True
-    )
-    
-    print(f"✅ Generated {len(embeddings)} embeddings")
-    print(f"   Shape: {embeddings.shape}")
-    print(f"   Dtype: {embeddings.dtype}")
-    
-    # Add embeddings to chunks
-    print(f"\n💾 Adding embeddings to chunks...")
-    for i, chunk in enumerate(tqdm(chunks, desc="Processing")):
-        chunk['embedding'] = embeddings[i].tolist()
-    
-    # Save with embeddings
-    print(f"\n💾 Saving to {output_file}...")
+# One encoder process per GPU when there is more than one (started in main)
+pool = None
+
+def encode(texts: list) -> np.ndarray:
+    """Embed texts on the local device, or across every GPU when pooled"""
+    if pool is not None:
+        return model.encode_multi_process(texts, pool, batch_size=BATCH_SIZE)
+    if DEVICE == "cuda":
+        # convert_to_numpy copies every batch to the host as it finishes,
+        # stalling the GPU each time. Keep the block's batches on the GPU
+        # and copy them back once, already FP16 (half the PCIe traffic).
+        embeddings = model.encode(texts, batch_size=BATCH_SIZE, convert_to_tensor=True)
+        return embeddings.half().cpu().numpy()
+    return model.encode(texts, batch_size=BATCH_SIZE, convert_to_numpy=True)
+
+def _text_key(text: str) -> bytes:
+    """Fixed-size digest identifying a chunk's text"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def generate_embeddings(chunks_file: str, output_file: str) -> int:
+    """Generate embeddings for chunks; returns how many were written.
+    
+    Chunks are streamed from the input with ijson and written back out as
+    they are embedded, BLOCK_SIZE at a time; only the compact FP16 vectors
+    accumulate in memory. ``output_file`` gets the chunk metadata as a JSON
+    array; the vectors go to the .npy file next to it as one FP16 (N, dim)
+    array whose row i belongs to chunk i. As JSON text a 384-dim vector is
+    ~6 KB; as FP16 it is 768 bytes, with negligible recall loss for MiniLM.
+    
+    Each distinct text is encoded once: repeated boilerplate chunks
+    (captions, syllabi, standard clauses) reuse the first one's vector.
+    """
+    print(f"\n🔄 Generating embeddings for {chunks_file}...")
     Path(output_file).parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w') as f:
-        json.dump(chunks, f)
-    
-    file_size = Path(output_file).stat().st_size / (1024 * 1024)
-    print(f"✅ Saved {len(chunks)} chunks with embeddings ({file_size:.2f} MB)")
-    
-    return chunks
+    count = 0
+    known = {}  # Text digest -> FP16 vector
+    keys = []   # Text digest of every chunk, in output order
+    with open(chunks_file, 'rb') as src, open(output_file, 'wb') as out, \
+            tqdm(desc="Embedding", unit="chunks") as pbar:
+        chunks = ijson.items(src, 'item', use_float=True)
+        out.write(b"[")
+        while block := list(islice(chunks, BLOCK_SIZE)):
+            block_keys = [_text_key(chunk['text']) for chunk in block]
+            new = {key: chunk['text'] for key, chunk in zip(block_keys, block) if key not in known}
+            if new:
+                known.update(zip(new, encode(list(new.values())).astype(np.float16)))
+            keys.extend(block_keys)
+            for chunk in block:
+                if count:
+                    out.write(b",")
+                out.write(orjson.dumps(chunk))
+                count += 1
+            pbar.update(len(block))
+        out.write(b"]")
+    
+    vectors_file = Path(output_file).with_suffix('.npy')
+    dimension = model.get_sentence_embedding_dimension()
+    np.save(vectors_file, np.stack([known[key] for key in keys]) if keys else np.empty((0, dimension), np.float16))
+    
+    file_size = (Path(output_file).stat().st_size + vectors_file.stat().st_size) / (1024 * 1024)
+    print(f"✅ Saved {count} chunks with embeddings ({file_size:.2f} MB)")
+    print(f"   Encoded {len(known)} distinct texts ({count - len(known)} duplicates reused)")
+    print(f"   Vectors: {vectors_file}")
+    
+    return count
 
 def main():
     """Main embedding generation pipeline"""
+    global pool
     
     print("\n" + "=" * 60)
     print("🎯 Embedding Generation Pipeline")
@@ -87,28 +121,37 @@ def main():
         print("💡 Mount Google Drive and navigate to your project folder")
         return
     
-    # Generate CUAD embeddings
-    cuad_input = chunks_dir / "cuad_chunks.json"
-    cuad_output = Path("data/embeddings") / "cuad_embeddings.json"
-    
-    if cuad_input.exists():
-        print(f"\n�� Processing CUAD...")
-        generate_embeddings(str(cuad_input), str(cuad_output))
-    
-    # Generate CourtListener embeddings
-    cl_input = chunks_dir / "courtlistener_chunks.json"
-    cl_output = Path("data/embeddings") / "courtlistener_embeddings.json"
-    
-    if cl_input.exists():
-        print(f"\n⚖️  Processing CourtListener...")
-        generate_embeddings(str(cl_input), str(cl_output))
+    if torch.cuda.device_count() > 1:
+        print(f"🖥️  Encoding on {torch.cuda.device_count()} GPUs")
+        pool = model.start_multi_process_pool()
+    
+    try:
+        # Generate CUAD embeddings
+        cuad_input = chunks_dir / "cuad_chunks.json"
+        cuad_output = Path("data/embeddings") / "cuad_embeddings.json"
+        
+        if cuad_input.exists():
+            print(f"\n�� Processing CUAD...")
+            generate_embeddings(str(cuad_input), str(cuad_output))
+        
+        # Generate CourtListener embeddings
+        cl_input = chunks_dir / "courtlistener_chunks.json"
+        cl_output = Path("data/embeddings") / "courtlistener_embeddings.json"
+        
+        if cl_input.exists():
+            print(f"\n⚖️  Processing CourtListener...")
+            generate_embeddings(str(cl_input), str(cl_output))
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+            pool = None
     
     print("\n" + "=" * 60)
     print("✅ Embedding Generation Complete!")
     print("=" * 60)
     print("📁 Output files:")
-    print(f"   • {cuad_output}")
-    print(f"   • {cl_output}")
+    print(f"   • {cuad_output} (+ {cuad_output.with_suffix('.npy').name})")
+    print(f"   • {cl_output} (+ {cl_output.with_suffix('.npy').name})")
     print("\n🎯 Next: Download embeddings and upload to Qdrant")
     print("=" * 60)
 
@@ -3,14 +3,56 @@ Generate Embeddings using Google Vertex AI
 Cost: ~$1.25 for 100K documents
 """
 
-import json
+import hashlib
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from tqdm import tqdm
+import numpy as np
+import ijson
+import orjson
+import tiktoken
 from google.cloud import aiplatform
 from vertexai.language_models import TextEmbeddingModel
 import time
 
+# Vertex AI embedding quota, and how many requests may be in flight at once
+REQUESTS_PER_SECOND = 5
+MAX_CONCURRENT_REQUESTS = 16
+
+# Per-request limits: 250 texts and 20k tokens. cl100k is not Vertex's own
+# tokenizer, so batches stop at 18k to leave room for the difference.
+MAX_BATCH_TEXTS = 250
+MAX_BATCH_TOKENS = 18_000
+
+@lru_cache(maxsize=None)
+def _encoding():
+    return tiktoken.get_encoding("cl100k_base")  # Downloaded and cached on first use
+
+def count_tokens(texts: list) -> list:
+    """Approximate token count of each text (cl100k_base)"""
+    return [len(tokens) for tokens in _encoding().encode_ordinary_batch(texts)]
+
+def token_batches(texts: list, token_counts: list, batch_size: int = MAX_BATCH_TEXTS) -> list:
+    """Split texts, in order, into batches within both request limits"""
+    batches, batch, batch_tokens = [], [], 0
+    for text, tokens in zip(texts, token_counts):
+        if batch and (len(batch) == batch_size or batch_tokens + tokens > MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _text_key(text: str) -> bytes:
+    """Fixed-size digest identifying a document's text"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
 class VertexAIEmbedder:
     """Generate embeddings using Vertex AI"""
     
@@ -31,93 +73,123 @@ class VertexAIEmbedder:
         # Load embedding model
         self.model = TextEmbeddingModel.from_pretrained("text-embedding-004")
         
+        # Request start times are spaced 1/REQUESTS_PER_SECOND apart across threads
+        self._rate_lock = threading.Lock()
+        self._next_request = 0.0
+        
         print(f"✅ Initialized Vertex AI in {project_id}/{location}")
     
-    def generate_embeddings_batch(self, texts: list, batch_size: int = 250) -> list:
+    def _get_embeddings(self, texts: list) -> list:
+        """One rate-limited Vertex AI request"""
+        with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._next_request)
+            self._next_request = start + 1 / REQUESTS_PER_SECOND
+        if start > now:
+            time.sleep(start - now)
+        return [emb.values for emb in self.model.get_embeddings(texts)]
+    
+    def _embed_batch(self, batch: list) -> list:
+        """Embed one batch, falling back to one request per text on error"""
+        try:
+            return self._get_embeddings(batch)
+        except Exception as e:
+            print(f"\n⚠️ Error on batch of {len(batch)}: {e}")
+            # Retry with smaller batch
+            batch_embeddings = []
+            for text in batch:
+                try:
+                    batch_embeddings.extend(self._get_embeddings([text]))
+                except Exception as retry_error:
+                    print(f"Failed to embed text: {retry_error}")
+                    # Add zero vector as placeholder
+                    batch_embeddings.append([0.0] * 768)
+            return batch_embeddings
+    
+    def generate_embeddings_batch(self, texts: list, batch_size: int = MAX_BATCH_TEXTS,
+                                  token_counts: list = None) -> list:
         """
         Generate embeddings in batches
         
+        Batches hold up to ``batch_size`` texts and MAX_BATCH_TOKENS tokens,
+        so short texts share full requests and long ones never push a
+        request over the token limit. Up to MAX_CONCURRENT_REQUESTS batches
+        are in flight at once, so the API round trips overlap instead of
+        running back to back; request starts are still paced to
+        REQUESTS_PER_SECOND.
+        
         Args:
             texts: List of text strings
             batch_size: Number of texts per batch (max 250 for Vertex AI)
+            token_counts: Token count per text, if already known
         
         Returns:
-            List of embedding vectors
+            List of embedding vectors, in the order of ``texts``
         """
-        all_embeddings = []
-        
-        for i in tqdm(range(0, len(texts), batch_size), desc="Generating embeddings"):
-            batch = texts[i:i+batch_size]
-            
-            try:
-                # Generate embeddings for batch
-                embeddings = self.model.get_embeddings(batch)
-                
-                # Extract embedding values
-                batch_embeddings = [emb.values for emb in embeddings]
-                all_embeddings.extend(batch_embeddings)
-                
-                # Rate limiting (5 requests per second)
-                time.sleep(0.2)
-                
-            except Exception as e:
-                print(f"\n⚠️ Error on batch {i//batch_size}: {e}")
-                # Retry with smaller batch
-                if len(batch) > 1:
-                    for text in batch:
-                        try:
-                            emb = self.model.get_embeddings([text])
-                            all_embeddings.append(emb[0].values)
-                            time.sleep(0.3)
-                        except Exception as retry_error:
-                            print(f"Failed to embed text: {retry_error}")
-                            # Add zero vector as placeholder
-                            all_embeddings.append([0.0] * 768)
-        
-        return all_embeddings
+        if token_counts is None:
+            token_counts = count_tokens(texts)
+        batches = token_batches(texts, token_counts, batch_size)
+        
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            results = list(tqdm(
+                executor.map(self._embed_batch, batches),
+                total=len(batches),
+                desc="Generating embeddings",
+            ))
+        
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
     
     def process_dataset(self, input_file: Path, output_file: Path, 
-                       batch_size: int = 250):
+                       batch_size: int = MAX_BATCH_TEXTS, block_size: int = 10_000):
         """
         Generate embeddings for entire dataset
         
+        Documents are streamed from the input with ijson and written out as
+        they are embedded, ``block_size`` at a time, so memory stays at one
+        block. The output is still one JSON array of documents.
+        
+        Each distinct text is sent to the API (and paid for) once: repeated
+        boilerplate chunks reuse the first one's embedding, kept as float32
+        (3 KB per distinct text at 768 dims).
+        
         Args:
             input_file: Path to chunked JSON data
             output_file: Path to save embeddings
             batch_size: Batch size for API calls
+            block_size: Documents read and embedded per step
         """
-        print(f"📖 Loading data from {input_file}...")
-        
-        with open(input_file, 'r') as f:
-            documents = json.load(f)
-        
-        print(f"🧠 Generating embeddings for {len(documents)} documents...")
-        print(f"💰 Estimated cost: ${len(documents) * 1000 * 0.025 / 1_000_000:.2f}")
-        
-        # Extract texts
-        texts = [doc['text'] for doc in documents]
-        
-        # Generate embeddings
-        embeddings = self.generate_embeddings_batch(texts, batch_size)
-        
-        # Combine documents with embeddings
-        embedded_documents = []
-        for doc, embedding in zip(documents, embeddings):
-            doc['embedding'] = embedding
-            embedded_documents.append(doc)
-        
-        # Save to file
-        print(f"💾 Saving embeddings to {output_file}...")
+        print(f"🧠 Generating embeddings for {input_file}...")
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w') as f:
-            json.dump(embedded_documents, f)
-        
-        print(f"\n✅ Generated {len(embedded_documents)} embeddings")
-        print(f"📊 Embedding dimension: {len(embeddings[0])}")
+        count = 0
+        total_tokens = 0
+        known = {}  # Text digest -> float32 embedding
+        with open(input_file, 'rb') as src, open(output_file, 'wb') as out:
+            documents = ijson.items(src, 'item', use_float=True)
+            out.write(b"[")
+            while block := list(islice(documents, block_size)):
+                block_keys = [_text_key(doc['text']) for doc in block]
+                new = {key: doc['text'] for key, doc in zip(block_keys, block) if key not in known}
+                if new:
+                    texts = list(new.values())
+                    token_counts = count_tokens(texts)
+                    total_tokens += sum(token_counts)
+                    embeddings = self.generate_embeddings_batch(texts, batch_size, token_counts)
+                    known.update(zip(new, np.asarray(embeddings, dtype=np.float32)))
+                for doc, key in zip(block, block_keys):
+                    doc['embedding'] = known[key]
+                    if count:
+                        out.write(b",")
+                    out.write(orjson.dumps(doc, option=orjson.OPT_SERIALIZE_NUMPY))
+                    count += 1
+            out.write(b"]")
+        
+        print(f"\n✅ Generated {count} embeddings")
+        print(f"   Embedded {len(known)} distinct texts ({count - len(known)} duplicates reused)")
+        print(f"💾 Saved to {output_file}")
+        print(f"📊 Embedding dimension: {len(next(iter(known.values()))) if known else 0}")
         
         # Calculate actual cost
-        total_tokens = sum(len(text.split()) * 1.3 for text in texts)  # Approx tokens
         actual_cost = total_tokens * 0.025 / 1_000_000
         print(f"💰 Actual cost: ~${actual_cost:.2f}")
 
@@ -1,23 +1,114 @@
 #!/usr/bin/env python3
-import json
+import gzip
 import os
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from tqdm import tqdm
+import ijson
+import numpy as np
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
-import uuid
+
+GRPC_PORT = 6334
+CLIENT_TIMEOUT = 60  # Seconds; large upsert batches take a while on a cold cluster
+UPLOAD_BATCH_SIZE = 512
+UPLOAD_PARALLEL = min(4, os.cpu_count() or 1)
+# Chunks held in memory per upload_collection call while streaming a file.
+# Large enough that each call keeps every worker busy for many batches.
+STREAM_BLOCK_SIZE = UPLOAD_BATCH_SIZE * UPLOAD_PARALLEL * 8
+
+@lru_cache(maxsize=None)
+def get_client(url=None, api_key=None):
+    """One client per cluster, shared by every populator in the process.
+
+    gRPC multiplexes the upsert batches over a single HTTP/2 channel instead
+    of a REST request per batch. Without credentials this is an in-process
+    ``:memory:`` instance for local runs.
+    """
+    if url and api_key:
+        return QdrantClient(
+            url=url,
+            api_key=api_key,
+            prefer_grpc=True,
+            grpc_port=GRPC_PORT,
+            timeout=CLIENT_TIMEOUT,
+        )
+    return QdrantClient(":memory:")
 
 class QdrantPopulator:
     def __init__(self):
-        url = os.getenv('QDRANT_URL')
-        api_key = os.getenv('QDRANT_API_KEY')
-        if url and api_key:
-            self.client = QdrantClient(url=url, api_key=api_key)
-        else:
-            self.client = QdrantClient(":memory:")
+        self.client = get_client(os.getenv('QDRANT_URL'), os.getenv('QDRANT_API_KEY'))
+
+    def close(self):
+        """Release the gRPC channel; the next populator reconnects."""
+        self.client.close()
+        get_client.cache_clear()
+
+    def upload_chunks(self, collection_name, chunks, start_id=0, vectors=None):
+        """Upload embedded chunks (``embedding`` plus metadata) to a collection.
+
+        ``vectors`` (row i for chunk i) replaces the ``embedding`` fields
+        when the embeddings were saved separately as an .npy array.
+
+        The vectors go over as one contiguous float32 array and the client
+        sends them UPLOAD_BATCH_SIZE points per request across
+        UPLOAD_PARALLEL workers, instead of one PointStruct upsert per chunk.
+        Points get sequential integer ids from ``start_id`` (as in
+        upload_to_qdrant.py), so re-running over the same file overwrites
+        points instead of duplicating them under fresh random UUIDs.
+        """
+        if vectors is None:
+            vectors = [chunk['embedding'] for chunk in chunks]
+        elif len(vectors) != len(chunks):
+            raise ValueError(f"Got {len(vectors):,} vectors for {len(chunks):,} chunks")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        payloads = [{k: v for k, v in chunk.items() if k != 'embedding'} for chunk in chunks]
+        self.client.upload_collection(
+            collection_name=collection_name,
+            vectors=vectors,
+            payload=payloads,
+            ids=range(start_id, start_id + len(payloads)),
+            batch_size=UPLOAD_BATCH_SIZE,
+            parallel=UPLOAD_PARALLEL,
+        )
+        return len(payloads)
+
+    def upload_file(self, collection_name, embeddings_file):
+        """Stream an embeddings JSON array (optionally .json.gz) into a collection.
+
+        ijson yields one chunk at a time, so memory stays at one
+        STREAM_BLOCK_SIZE block instead of the whole parsed file. When an
+        .npy file sits next to it (FP16 vectors from
+        generate_embeddings_colab.py), the vectors are read from there,
+        memory-mapped, instead of from each chunk's ``embedding``; it must
+        hold exactly one row per chunk.
+        """
+        embeddings_file = Path(embeddings_file)
+        opener = gzip.open if embeddings_file.suffix == '.gz' else open
+        vectors_file = Path(str(embeddings_file).removesuffix('.gz')).with_suffix('.npy')
+        vectors = np.load(vectors_file, mmap_mode='r') if vectors_file.exists() else None
+        uploaded = 0
+        with opener(embeddings_file, 'rb') as f:
+            chunks = ijson.items(f, 'item', use_float=True)
+            while block := list(islice(chunks, STREAM_BLOCK_SIZE)):
+                block_vectors = None if vectors is None else vectors[uploaded:uploaded + len(block)]
+                if block_vectors is not None and len(block_vectors) != len(block):
+                    raise ValueError(
+                        f"{vectors_file} has {vectors.shape[0]:,} vectors but "
+                        f"{embeddings_file} has more chunks; regenerate the embeddings"
+                    )
+                uploaded += self.upload_chunks(
+                    collection_name, block, start_id=uploaded, vectors=block_vectors
+                )
+        if vectors is not None and uploaded != vectors.shape[0]:
+            raise ValueError(
+                f"{vectors_file} has {vectors.shape[0]:,} vectors for {uploaded:,} chunks "
+                f"in {embeddings_file}; regenerate the embeddings"
+            )
+        return uploaded
 
 def main():
     populator = QdrantPopulator()
+    populator.close()
 
 if __name__ == "__main__":
     main()